@@ -1,23 +1,232 @@
 import argparse
-from src.bertrand import bertrand_game
-from src.cournot import cournot_game
-from src.relationship_brf import brf_game
+from src.sweep import parse_values, run_sweep
+from src import cache, profiling, registry, tiled
+
+# Game modules are loaded through src/registry.py when they are needed, and
+# matplotlib only when something is drawn
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return float(width), float(height)
+
+def compute(args):
+    game = args.compute_game
+    options = {}
+    if args.num_points is not None:
+        options['num_points'] = args.num_points
+    if game in ('cournot', 'bertrand'):
+        options['frame'] = args.frame
+    if args.adaptive and game != 'folk':
+        options['adaptive'] = True
+    if args.discrete:
+        options['discrete'] = True
+    result = registry.compute(game, *registry.game_params(game, vars(args)), **options)
+
+    if game == 'folk':
+        deltas, x_values, y_values = result
+        print(f'{len(deltas)} frames, delta {deltas[-1]:g} to {deltas[0]:g}, average payoffs {y_values.min():g} to {y_values.max():g}')
+    else:
+        points, (a, c, payoff_1, payoff_2, best_response_1, best_response_2, nash) = result
+        x1, x2, nash_payoff_1, nash_payoff_2 = nash
+        print(f'a={a}, c={c}, {len(points)} grid points up to {points[-1]:g}')
+        print(f'Nash equilibrium: actions ({x1:g}, {x2:g}), payoffs ({nash_payoff_1:g}, {nash_payoff_2:g})')
+
+    if args.output:
+        import numpy as np
+        np.savez(args.output, **registry.result_arrays(game, result))
+        print(f'Wrote {args.output}')
 
 def main():
     parser = argparse.ArgumentParser(description='Game Theory Visualization')
-    parser.add_argument('game', choices=['bertrand', 'cournot', 'brf'], help='Type of game to visualize')
-    parser.add_argument('--a', type=float, help='Parameter a')
-    parser.add_argument('--c', type=float, help='Parameter c')
-    parser.add_argument('--animate', type=str, help='Parameter to animate the Cournot game')
-    
+    subparsers = parser.add_subparsers(dest='game', required=True, metavar='game', help='Type of game to visualize (bertrand, cournot, brf, folk), compute, sweep, surface, montecarlo, tournament, serve or bench')
+
+    game_parser = argparse.ArgumentParser(add_help=False)
+    game_parser.add_argument('--a', type=float, help='Parameter a')
+    game_parser.add_argument('--c', type=float, help='Parameter c')
+    game_parser.add_argument('--animate', type=str, default='false', help='Parameter to animate the Cournot game')
+    game_parser.add_argument('--interactive', action='store_true', help='Explore the game with sliders for its parameters and grid size')
+    game_parser.add_argument('--adaptive', action='store_true', help='Sample payoff surfaces adaptively, densest along best responses and discontinuities')
+    game_parser.add_argument('--discrete', action='store_true', help='Draw the best responses and equilibrium of the game restricted to the grid (cournot, bertrand)')
+    game_parser.add_argument('--detail', choices=['low', 'medium', 'high', 'full'], default='medium',
+                             help='Render budget: caps on surface polygons, contour resolution and levels, and markers (payoffs and equilibria are always computed in full)')
+    game_parser.add_argument('--output', type=str, help='Render headlessly to a directory of PNG frames, a .png, .gif or video file (.mp4 needs ffmpeg)')
+    game_parser.add_argument('--workers', type=int, help='Number of processes used to render frames with --output (default: all cores)')
+    game_parser.add_argument('--dpi', type=float, help='Resolution of exported frames')
+    game_parser.add_argument('--size', type=parse_size, help='Size of exported frames in inches, e.g. 12x10')
+    game_parser.add_argument('--fps', type=float, default=20, help='Frame rate of exported GIFs and videos')
+    game_parser.add_argument('--no-cache', action='store_true', help='Compute every frame instead of loading it from the on-disk cache')
+    game_parser.add_argument('--profile', type=str, help='Write per-frame stage timings to this JSON file and a Chrome trace next to it (<name>.trace.json)')
+    for game in ['bertrand', 'cournot', 'brf', 'folk']:
+        subparsers.add_parser(game, parents=[game_parser])
+
+    sweep_parser = subparsers.add_parser('sweep', help='Tabulate equilibria over a grid of parameters')
+    sweep_parser.add_argument('--games', type=lambda s: s.split(','), default=['cournot', 'bertrand', 'brf'], help='Comma separated games to sweep')
+    sweep_parser.add_argument('--a', type=parse_values, required=True, help="Values of a, 'start:stop:num' or a comma separated list")
+    sweep_parser.add_argument('--c', type=parse_values, required=True, help="Values of c, 'start:stop:num' or a comma separated list")
+    sweep_parser.add_argument('--num-points', type=lambda s: parse_values(s, int), default=[100], help='Grid resolutions, same format as --a')
+    sweep_parser.add_argument('--output', type=str, required=True, help='Results file: .csv, .npz or .parquet (needs pyarrow)')
+    sweep_parser.add_argument('--workers', type=int, help='Number of worker processes (default: all cores)')
+    sweep_parser.add_argument('--chunk-size', type=int, default=256, help='Parameter sets per scheduled chunk')
+    sweep_parser.add_argument('--resume', action='store_true', help='Skip chunks already recorded in <output>.progress')
+
+    surface_parser = subparsers.add_parser('surface', help='Compute one very large payoff surface in tiles into memory-mapped .npy files')
+    surface_parser.add_argument('surface_game', choices=['cournot', 'bertrand', 'brf'], help='Game to compute')
+    surface_parser.add_argument('--a', type=float, help='Parameter a (cournot, bertrand)')
+    surface_parser.add_argument('--c', type=float, required=True, help='Parameter c')
+    surface_parser.add_argument('--num-points', type=int, default=10000, help='Grid resolution per axis')
+    surface_parser.add_argument('--output', type=str, required=True, help='Directory for payoff_1.npy, payoff_2.npy and best_response_1.npy')
+    surface_parser.add_argument('--tile', type=int, default=tiled.TILE, help='Rows and columns computed per block')
+    surface_parser.add_argument('--dtype', choices=['float32', 'float64'], default='float32', help='Precision of the stored surfaces')
+    surface_parser.add_argument('--preview', type=str, help='Also render a downsampled image of the surfaces to this file')
+
+    compute_parser = subparsers.add_parser('compute', help='Print a game\'s equilibrium and optionally save its arrays, without matplotlib')
+    compute_parser.add_argument('compute_game', choices=list(registry.GAMES), help='Game to compute')
+    compute_parser.add_argument('--a', type=float, help='Parameter a')
+    compute_parser.add_argument('--c', type=float, help='Parameter c')
+    compute_parser.add_argument('--num-points', type=int, help='Grid resolution (default: the plotted one)')
+    compute_parser.add_argument('--frame', type=int, default=0, help='Animation frame to compute (cournot, bertrand)')
+    compute_parser.add_argument('--adaptive', action='store_true', help='Sample payoff surfaces adaptively')
+    compute_parser.add_argument('--discrete', action='store_true', help='Best responses and equilibrium of the game restricted to the grid (cournot, bertrand)')
+    compute_parser.add_argument('--no-cache', action='store_true', help='Compute instead of loading from the on-disk cache')
+    compute_parser.add_argument('--output', type=str, help='Save the arrays to this .npz file')
+
+    montecarlo_parser = subparsers.add_parser('montecarlo', help='Expected payoffs and best responses when a and c are random')
+    montecarlo_parser.add_argument('montecarlo_game', choices=['cournot', 'bertrand'], help='Game to simulate')
+    montecarlo_parser.add_argument('--a', type=str, required=True, help="Distribution of a: a constant, normal:<mean>:<std>, uniform:<low>:<high>, triangular:<left>:<mode>:<right> or lognormal:<mean>:<sigma>")
+    montecarlo_parser.add_argument('--c', type=str, required=True, help='Distribution of c, same format as --a')
+    montecarlo_parser.add_argument('--samples', type=int, default=10000, help='Number of (a, c) draws')
+    montecarlo_parser.add_argument('--num-points', type=int, default=100, help='Grid resolution')
+    montecarlo_parser.add_argument('--quantiles', type=parse_values, default=[0.05, 0.5, 0.95], help='Payoff quantiles to estimate, same format as sweep --a')
+    montecarlo_parser.add_argument('--bins', type=int, default=64, help='Histogram bins per grid cell for the quantiles')
+    montecarlo_parser.add_argument('--workers', type=int, help='Number of worker processes (default: all cores)')
+    montecarlo_parser.add_argument('--seed', type=int, default=0, help='Seed; results do not depend on --workers')
+    montecarlo_parser.add_argument('--output', type=str, help='Save the surfaces to this .npz file')
+
+    tournament_parser = subparsers.add_parser('tournament', help='Play repeated prisoner\'s dilemma tournaments between strategy populations')
+    tournament_parser.add_argument('--population', type=str, required=True,
+                                   help="Comma separated strategies name[:args][*count]: allc, alld, grim, tft, random:<p>, cycle:<defections>:<length>")
+    tournament_parser.add_argument('--deltas', type=parse_values, default=[0.5, 0.9, 0.99], help="Discount factors, 'start:stop:num' or a comma separated list")
+    tournament_parser.add_argument('--rounds', type=int, default=200, help='Rounds per match')
+    tournament_parser.add_argument('--matches', type=int, help='Play this many random pairings instead of every pair once')
+    tournament_parser.add_argument('--workers', type=int, help='Number of worker processes (default: all cores)')
+    tournament_parser.add_argument('--chunk-size', type=int, default=16384, help='Matches played at once per chunk')
+    tournament_parser.add_argument('--seed', type=int, default=0, help='Seed of the random strategies and pairings')
+    tournament_parser.add_argument('--output', type=str, help='Write mean payoffs per strategy pair and delta to this CSV file')
+    tournament_parser.add_argument('--plot', type=str, help='Plot the payoffs at the last delta against the feasible payoff set to this image')
+
+    serve_parser = subparsers.add_parser('serve', help='Serve charts and equilibrium data over HTTP from warm worker processes')
+    serve_parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    serve_parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    serve_parser.add_argument('--workers', type=int, help='Number of render processes (default: all cores)')
+    serve_parser.add_argument('--cache-mb', type=float, default=256, help='Size of the response cache in MiB')
+    serve_parser.add_argument('--max-concurrent', type=int, help='Renders running at once (default: one per worker)')
+    serve_parser.add_argument('--max-queue', type=int, default=64, help='Distinct renders allowed to wait before requests get 503')
+
+    bench_parser = subparsers.add_parser('bench', help='Time and measure the memory of every game stage at several grid sizes')
+    bench_parser.add_argument('--games', type=lambda s: s.split(','), help='Comma separated games (default: all)')
+    bench_parser.add_argument('--sizes', type=lambda s: parse_values(s, int), help='Grid sizes, same format as sweep --a (default: 50,100,300,1000)')
+    bench_parser.add_argument('--stages', type=lambda s: s.split(','), help='Comma separated stages: surface, best_response, frame, render (default: all)')
+    bench_parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+    bench_parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+    bench_parser.add_argument('--baseline', type=str, help='JSON results of an earlier run on this machine to compare against')
+    bench_parser.add_argument('--threshold', type=float, help='Allowed slowdown against the baseline as a fraction (default: 0.5, 1 for frame and render)')
+    bench_parser.add_argument('--memory-threshold', type=float, default=0.25, help='Allowed peak memory growth against the baseline as a fraction')
+
     args = parser.parse_args()
+    if args.game == 'surface' and args.surface_game != 'brf' and args.a is None:
+        parser.error(f'surface {args.surface_game} needs --a')
+    if args.game in ('brf', 'folk') and args.discrete:
+        parser.error('--discrete is only available for cournot and bertrand')
+    if args.game in ('cournot', 'bertrand') and not args.interactive:
+        if args.a is None or args.c is None:
+            parser.error(f'{args.game} needs --a and --c')
+        if args.a <= args.c:
+            parser.error('--a must be greater than --c')
+        # The animations run c from its value up to a, one frame per unit
+        if (args.animate.lower() in {'true', '1', 't'} or args.output) and args.a - args.c < 1:
+            parser.error('--a must exceed --c by at least 1 to animate or export, there is one frame per unit between them')
+    profile = getattr(args, 'profile', None)
+    if profile:
+        profiling.enable()
+    if getattr(args, 'no_cache', False):
+        cache.disable()
 
-    if args.game == 'bertrand':
-        bertrand_game(args.a, args.c, args.animate)
+    if args.game == 'sweep':
+        run_sweep(args.games, args.a, args.c, args.num_points, args.output, workers=args.workers, chunk_size=args.chunk_size, resume=args.resume)
+    elif args.game == 'bench':
+        from src.benchmark import run_benchmarks
+        regressions = run_benchmarks(args.games, args.sizes, args.stages, args.repeat, args.output, args.baseline, args.threshold, args.memory_threshold)
+        if regressions:
+            raise SystemExit(1)
+    elif args.game == 'montecarlo':
+        import numpy as np
+        from src.montecarlo import expected_surfaces
+        result = expected_surfaces(args.montecarlo_game, args.a, args.c, args.samples, args.num_points, args.quantiles,
+                                   workers=args.workers, seed=args.seed, bins=args.bins)
+        row, col = np.unravel_index(result['mean'].argmax(), result['mean'].shape)
+        points = result['points']
+        print(f"{result['samples']} samples on {len(points)} grid points up to {points[-1]:g}")
+        print(f"Highest expected payoff {result['mean'][row, col]:g} (std {np.sqrt(result['variance'][row, col]):g}) "
+              f"at own action {points[col]:g} against {points[row]:g}")
+        if args.output:
+            np.savez(args.output, **result)
+            print(f'Wrote {args.output}')
+    elif args.game == 'tournament':
+        from src import tournament
+        pairing = 'random' if args.matches else 'round_robin'
+        labels, means, counts = tournament.run_tournament(args.population, args.deltas, args.rounds, pairing, args.matches,
+                                                          workers=args.workers, chunk_size=args.chunk_size, seed=args.seed)
+        tournament.print_standings(labels, args.deltas, means, counts)
+        if args.output:
+            tournament.write_results(args.output, labels, args.deltas, means, counts)
+        if args.plot:
+            tournament.plot_results(args.plot, labels, args.deltas, means)
+    elif args.game == 'serve':
+        from src.server import serve
+        serve(args.host, args.port, args.workers, int(args.cache_mb * 2 ** 20), args.max_concurrent, args.max_queue)
+    elif args.game == 'compute':
+        game = args.compute_game
+        if args.discrete and game not in ('cournot', 'bertrand'):
+            parser.error('--discrete is only available for cournot and bertrand')
+        missing = [f'--{name}' for name in registry.PARAMS[game] if getattr(args, name) is None]
+        if missing:
+            parser.error(f'compute {game} needs {" and ".join(missing)}')
+        if game in ('cournot', 'bertrand'):
+            if args.a <= args.c:
+                parser.error('--a must be greater than --c')
+            num_frames = registry.load(game).frame_count(args.a, args.c)
+            if not 0 <= args.frame < max(num_frames, 1):
+                parser.error(f'--frame must be between 0 and {max(num_frames, 1) - 1}')
+        compute(args)
+    elif args.game == 'surface':
+        tiled.game_surfaces(args.surface_game, args.a, args.c, args.num_points, args.output, tile=args.tile, dtype=args.dtype)
+        for name, surface in zip(['payoff_1', 'payoff_2'], tiled.load_surfaces(args.output)):
+            print(name, tiled.surface_stats(surface, args.tile))
+        if args.preview:
+            tiled.render_preview(args.surface_game, args.a, args.c, args.output, args.preview)
+    elif args.interactive:
+        from src.interactive import interactive_game
+        interactive_game(args.game, {'a': args.a, 'c': args.c}, args.detail, args.discrete)
+    elif args.output:
+        from src.export import export_animation
+        params = registry.game_params(args.game, vars(args))
+        options = {'adaptive': True} if args.adaptive else {}
+        if args.game != 'folk':
+            options['detail'] = args.detail
+        if args.discrete:
+            options['discrete'] = True
+        export_animation(args.game, params, args.output, workers=args.workers, dpi=args.dpi, size=args.size, fps=args.fps, options=options)
+    elif args.game == 'bertrand':
+        registry.load('bertrand').bertrand_game(args.a, args.c, args.animate, args.adaptive, args.detail, args.discrete)
     elif args.game == 'cournot':
-        cournot_game(args.a, args.c, args.animate)
+        registry.load('cournot').cournot_game(args.a, args.c, args.animate, args.adaptive, args.detail, args.discrete)
     elif args.game == 'brf':
-        brf_game(args.c)
+        registry.load('brf').brf_game(args.c, args.adaptive, args.detail)
+    elif args.game == 'folk':
+        registry.load('folk').folk_game()
+
+    if profile:
+        profiling.write(profile)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Adaptive sampling of payoff surfaces.
+#
+# The domain [0, x_max] x [0, y_max] starts as a base x base grid of cells
+# and is refined as a quadtree. A cell is split when bilinear interpolation
+# from its corners misses the value at its centre by more than tol of the
+# payoff range (payoff kinks and jumps such as Bertrand's p1 == p2 tie), or
+# when one of the feature functions changes sign across it (best response
+# curves, given as f(x, y) = 0). Points concentrate where the surface is
+# interesting instead of being spread uniformly.
+#
+# levels() picks the base and depth whose finest cells are as fine as a
+# uniform grid of num_points, and max_samples caps the refinement: once the
+# samples could exceed it, only the cells missing their centre by the most
+# are split (feature crossings and NaNs first).
+
+Samples = namedtuple('Samples', ['x', 'y', 'z'])
+
+CORNERS_X = np.array([0, 1, 0, 1])
+CORNERS_Y = np.array([0, 0, 1, 1])
+
+def crosses(values):
+    # True for the rows whose values change sign or touch zero
+    return ((values.min(axis=1) < 0) & (values.max(axis=1) > 0)) | (values == 0).any(axis=1)
+
+def levels(num_points, base=16):
+    # (base, max_depth) with base * 2 ** max_depth >= num_points - 1 cells
+    cells = max(num_points - 1, 1)
+    base = min(base, cells)
+    return base, int(np.ceil(np.log2(cells / base)))
+
+def refine(payoff, x_max, y_max, base=16, max_depth=5, tol=0.01, features=(), max_samples=None):
+    # Cells are kept in integer units of the finest level, so shared corners
+    # of neighbouring cells coincide exactly. A split adds at most five
+    # corners (its centre and edge midpoints), which bounds the samples.
+    finest = base * 2 ** max_depth
+    hx, hy = x_max / finest, y_max / finest
+    size = 2 ** max_depth
+    iy, ix = (np.mgrid[0:base, 0:base] * size).reshape(2, -1)
+
+    leaves = []
+    scale = None
+    samples = (base + 1) ** 2
+    for depth in range(max_depth):
+        half = size // 2
+        X = np.column_stack([ix[:, None] + CORNERS_X * size, ix + half]) * hx
+        Y = np.column_stack([iy[:, None] + CORNERS_Y * size, iy + half]) * hy
+        Z = payoff(X, Y)
+        if scale is None:
+            scale = tol * (np.nanmax(Z) - np.nanmin(Z)) or tol
+
+        error = np.abs(Z[:, 4] - Z[:, :4].mean(axis=1))
+        # NaN payoffs (undefined regions) count as needing refinement
+        error[np.isnan(error)] = np.inf
+        for feature in features:
+            error[crosses(feature(X, Y))] = np.inf
+        split = error > scale
+        if max_samples is not None:
+            allowed = max((max_samples - samples) // 5, 0)
+            if split.sum() > allowed:
+                split[:] = False
+                split[np.argsort(-error, kind='stable')[:allowed]] = True
+            samples += 5 * split.sum()
+
+        leaves.append((ix[~split], iy[~split], size))
+        ix, iy = ix[split], iy[split]
+        ix = np.concatenate([ix, ix + half, ix, ix + half])
+        iy = np.concatenate([iy, iy, iy + half, iy + half])
+        size = half
+    leaves.append((ix, iy, size))
+
+    # Evaluate every distinct leaf corner once
+    keys = np.unique(np.concatenate([
+        (iy[:, None] + CORNERS_Y * size) * (finest + 1) + ix[:, None] + CORNERS_X * size
+        for ix, iy, size in leaves
+    ], axis=None))
+    x, y = (keys % (finest + 1)) * hx, (keys // (finest + 1)) * hy
+    return Samples(x, y, payoff(x, y))
+
+def swap_players(samples):
+    # Player 2's samples of a symmetric game, mirrored like the grid transpose
+    return Samples(samples.y, samples.x, samples.z)
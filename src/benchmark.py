@@ -0,0 +1,223 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+from src import cache, kernels, matrix_solver, registry
+
+# Benchmarks of every game's pipeline at several grid sizes.
+#
+# Stages:
+#   surface        both payoff surfaces on a size x size grid (for the folk
+#                  theorem, the payoffs of every frame with size points)
+#   best_response  the closed-form best response curves at size points
+#   frame          producing and drawing one animation frame (update()), for
+#                  the animated games only
+#   render         a frame followed by rasterizing the whole figure with Agg
+#
+# Every case is timed repeat times after a warm-up call, then run once more
+# under tracemalloc for its peak memory. Results are written as JSON and,
+# when a baseline is given, compared against it. benchmarks/baseline.json is
+# a reference run committed with the code; timings only compare between runs
+# on the same machine, so record one with --output for the machine at hand.
+#
+# Before timing, the batched and streamed code is checked against direct
+# reference implementations on small inputs (see CHECKS); a failed check
+# counts as a regression.
+
+SIZES = [50, 100, 300, 1000]
+STAGES = ['surface', 'best_response', 'frame', 'render']
+PARAMS = {'cournot': (50, 1), 'bertrand': (50, 4), 'brf': (100,), 'folk': ()}
+# Default allowed slowdown of each stage. Drawing and rasterizing go through
+# much more of matplotlib and vary most between runs.
+THRESHOLDS = {'surface': 0.5, 'best_response': 0.5, 'frame': 1.0, 'render': 1.0}
+# Differences below these are treated as noise whatever the thresholds
+MIN_TIME_CHANGE = 1e-3
+MIN_MEMORY_CHANGE = 64 * 1024
+
+def measure(function, repeat):
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'min': min(times), 'median': statistics.median(times), 'runs': repeat, 'peak_bytes': peak}
+
+def frame_function(draw, frame_source, num_frames):
+    # One call per frame, cycling through the animation so every call draws
+    # a different frame than the last
+    state = {'frame': 0}
+
+    def frame():
+        state['frame'] = state['frame'] % (num_frames - 1) + 1 if num_frames > 1 else 0
+        draw(next(iter(frame_source(state['frame'], state['frame'] + 1))))
+
+    return frame
+
+def game_cases(game, size, stages):
+    # (stage, function) pairs for one game and grid size; the figure for the
+    # frame and render stages is only built if one of them is asked for
+    import matplotlib.pyplot as plt
+
+    module = registry.load(game)
+    params = PARAMS[game]
+    if game == 'folk':
+        deltas = 1 - np.arange(module.frame_count()) * 0.0001
+        yield 'surface', lambda: module.compute_segments(deltas, module.SEGMENTS, size, 10000)
+    else:
+        a, c = (np.nan,) + params if game == 'brf' else params
+        payoff, x_max = registry.game_definition(game, a, c)[:2]
+        points = np.linspace(0, x_max, size)
+        yield 'surface', lambda: kernels.symmetric_surfaces(payoff, points)
+        best_response_params = (c,) if game == 'brf' else (a, c)
+        yield 'best_response', lambda: module.plot_best_response(*best_response_params, x_max, size)
+
+    if 'frame' in stages or 'render' in stages:
+        fig, draw, frame_source, num_frames = module.create_figure(*params, num_points=size)
+        frame = frame_function(draw, frame_source, num_frames)
+        # A static game (brf) has a single frame and nothing to update
+        if num_frames > 1:
+            yield 'frame', frame
+        yield 'render', lambda: (frame(), fig.canvas.draw())
+        plt.close(fig)
+
+def check_best_response_sets():
+    # matrix_solver against the whole bimatrix, with blocks and tiles small
+    # enough that runs cross many tile boundaries. Rounded Cournot payoffs
+    # and Bertrand's zero-profit region give wide ties.
+    failures = []
+    cournot = registry.game_definition('cournot', 50, 1)[0]
+    cases = {'cournot': (cournot, 50), 'bertrand': registry.game_definition('bertrand', 50, 4)[:2],
+             'cournot_rounded': (lambda own, other: np.round(cournot(own, other) / 20), 50)}
+    for name, (payoff, x_max) in cases.items():
+        for num_points in (1, 2, 37, 64):
+            points = np.linspace(0, x_max, num_points)
+            values = payoff(*kernels.open_grid(points))
+            best = values.max(axis=1)
+            marked = values >= (best - 1e-9 * np.abs(best))[:, None]
+            expected_i, expected_j = np.nonzero(marked.T & marked)
+            for block_cells in (1, 7, 64, matrix_solver.BLOCK_CELLS):
+                responses = matrix_solver.best_response_sets(payoff, points, points, block_cells=block_cells)
+                found = np.zeros_like(marked)
+                for row, start, stop in zip(responses.row, responses.start, responses.stop):
+                    found[row, start:stop] = True
+                # Same sets, and every run whole (none split at a tile edge)
+                edges = np.diff(np.pad(marked, ((0, 0), (1, 0))).view(np.int8), axis=1)
+                i, j = matrix_solver.pure_equilibria(responses, batch_size=5)
+                order = np.lexsort((j, i))
+                if (not np.array_equal(found, marked) or len(responses.row) != (edges == 1).sum()
+                        or not np.array_equal(i[order], expected_i) or not np.array_equal(j[order], expected_j)):
+                    failures.append(f'best_response_sets {name} num_points={num_points} block_cells={block_cells}')
+    return failures
+
+def check_cycle_weights():
+    # folk_theorum's closed-form weights against the original loop over
+    # every generation
+    from src.folk_theorum import discounted_cycle_weights
+
+    failures = []
+    for delta in (1.0, 0.9999, 0.99, 0.5):
+        for num_points in (1, 2, 7, 30):
+            for num_generations in (0, 1, 29, 1000):
+                expected = np.zeros(num_points)
+                for n in range(1, num_generations + 1):
+                    expected[n % num_points] += delta ** n
+                expected /= num_generations + 1
+                weights = discounted_cycle_weights(np.array([delta]), num_points, num_generations)[0]
+                if not np.allclose(weights, expected, rtol=1e-12, atol=1e-15):
+                    failures.append(f'discounted_cycle_weights delta={delta} num_points={num_points} num_generations={num_generations}')
+            # The infinite horizon is a normalized average
+            if not np.isclose(discounted_cycle_weights(np.array([delta]), num_points).sum(), 1, rtol=1e-12):
+                failures.append(f'discounted_cycle_weights delta={delta} num_points={num_points} infinite horizon')
+    return failures
+
+CHECKS = [check_best_response_sets, check_cycle_weights]
+
+def run_checks():
+    failures = []
+    for check in CHECKS:
+        try:
+            failures += check()
+        except Exception as error:
+            failures.append(f'{check.__name__}: {type(error).__name__}: {error}')
+    print(f'{len(CHECKS)} check(s), {len(failures)} failure(s)')
+    return failures
+
+def run_benchmarks(games=None, sizes=None, stages=None, repeat=5, output=None, baseline=None, threshold=None, memory_threshold=0.25):
+    import matplotlib
+    matplotlib.use('Agg')
+    # Measure the computation, not loads from the on-disk cache
+    cache.disable()
+    # Read before measuring, so --output may overwrite the baseline
+    previous = None
+    if baseline is not None:
+        with open(baseline) as f:
+            previous = json.load(f)
+    failures = run_checks()
+    for failure in failures:
+        print('CHECK FAILED', failure)
+
+    games = games or list(registry.GAMES)
+    sizes = sizes or SIZES
+    stages = stages or STAGES
+    results = []
+    for game in games:
+        for size in sizes:
+            for stage, function in game_cases(game, size, stages):
+                if stage not in stages:
+                    continue
+                result = dict(game=game, stage=stage, size=size, **measure(function, repeat))
+                results.append(result)
+                print(f"{game:>9} {stage:>13} {size:>5}  {result['min'] * 1000:10.3f} ms  {result['peak_bytes'] / 2 ** 20:9.2f} MiB")
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'machine': platform.platform(),
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if previous is None:
+        return failures
+    if previous.get('machine') != report['machine']:
+        print(f"Baseline {baseline} was recorded on {previous.get('machine')}, times may not compare")
+    regressions = compare(results, previous['results'], threshold, memory_threshold)
+    for regression in regressions:
+        print('REGRESSION', regression)
+    print(f'{len(regressions)} regression(s) against {baseline}')
+    return failures + regressions
+
+def compare(results, baseline, threshold=None, memory_threshold=0.25):
+    # Cases slower or using more peak memory than the baseline by more than
+    # the given fractions (threshold=None: the stage's THRESHOLDS) and by more
+    # than the noise floors. A slowdown has to show in both the fastest and
+    # the median run, so one slow run on either side is not reported.
+    previous = {(r['game'], r['stage'], r['size']): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['game'], result['stage'], result['size']))
+        if before is None:
+            continue
+        name = f"{result['game']} {result['stage']} {result['size']}"
+        allowed = THRESHOLDS[result['stage']] if threshold is None else threshold
+        if all(result[key] > before[key] * (1 + allowed) and result[key] - before[key] > MIN_TIME_CHANGE for key in ('min', 'median')):
+            regressions.append(f"{name}: time {before['min'] * 1000:.3f} ms -> {result['min'] * 1000:.3f} ms")
+        if result['peak_bytes'] > before['peak_bytes'] * (1 + memory_threshold) and result['peak_bytes'] - before['peak_bytes'] > MIN_MEMORY_CHANGE:
+            regressions.append(f"{name}: peak memory {before['peak_bytes']} -> {result['peak_bytes']} bytes")
+    return regressions
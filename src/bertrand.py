@@ -1,161 +1,125 @@
+from functools import partial
+
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.animation import FuncAnimation
+from src import adaptive, cache, kernels, matrix_solver, profiling, solvers
 
 def plot_payoff(p1, p2, c, a):
-    if p1 > p2:
-        return 0
-    
-    if p1 == p2:
-        return 1/2 * (p1 - c)*(a - p1)
-    
-    return (p1 - c)*(a - p1)
-
-def plot_best_response(p1, p2, c, a):
-    tolerance = (5.48) * 1e-1
+    return kernels.bertrand_payoff(p1, p2, c, a)
+
+def plot_best_response(a, c, p_max, num_points):
+    # Player 1's piecewise best response, Player 2's is the same with the axes swapped
+    best_response_1 = solvers.bertrand_best_response(a, c, p_max, num_points)
+    return best_response_1, solvers.swap_players(best_response_1)
+
+def frames(initial_a, initial_c, p_points, num_frames, start=0):
+    # Payoff surfaces for the whole 'c' sweep, computed in batches of frames
+    # rather than one grid cell at a time
+    a_frames, c_frames = kernels.frame_params(initial_a, initial_c, num_frames, start)
+    for (c, a), payoff_values_1, payoff_values_2 in kernels.sweep_surfaces(plot_payoff, p_points, (c_frames, a_frames)):
+        with profiling.stage('best_response'):
+            best_response_1, best_response_2 = plot_best_response(a, c, p_points[-1], len(p_points))
+        yield a, c, payoff_values_1, payoff_values_2, best_response_1, best_response_2, solvers.bertrand_nash(a, c)
+
+def cached_frames(initial_a, initial_c, p_points, num_frames, start=0):
+    # frames() through the on-disk cache (see src/cache.py)
+    a_frames, c_frames = kernels.frame_params(initial_a, initial_c, num_frames, start)
+    return cache.frames('bertrand', p_points, zip(a_frames, c_frames),
+                        lambda i: frames(initial_a, initial_c, p_points, num_frames - i, start + i))
+
+def adaptive_frames(initial_a, initial_c, p_max, num_points, num_frames, start=0, max_samples=None):
+    # Same frames as frames() with adaptively refined payoff samples, dense
+    # along the p1 == p2 tie and the pieces of Player 1's best response.
+    # Cells get no finer than a grid of num_points, and there are at most
+    # max_samples samples (default num_points ** 2).
+    a_frames, c_frames = kernels.frame_params(initial_a, initial_c, num_frames, start)
+    for a, c in zip(a_frames, c_frames):
+        p_m = 1/2 * (a + c)
+        with profiling.stage('adaptive_refine'):
+            samples_1 = adaptive.refine(lambda p1, p2: plot_payoff(p1, p2, c, a), p_max, p_max, *adaptive.levels(num_points),
+                                        max_samples=max_samples or num_points ** 2,
+                                        features=[lambda p1, p2: p1 - p2, lambda p1, p2: p1 - c, lambda p1, p2: p1 - p_m])
+        best_response_1, best_response_2 = plot_best_response(a, c, p_max, num_points)
+        yield a, c, samples_1, adaptive.swap_players(samples_1), best_response_1, best_response_2, solvers.bertrand_nash(a, c)
+
+def frame_count(a, c):
+    return int(a - c)
+
+def update(frame_data, renderer):
+    with profiling.stage('update'):
+        return renderer.draw(*frame_data)
+
+def grid(a, c, num_points):
     p_m = 1/2 * (a + c)
-
-    if p2 < c and p1 > p2:
-        return plot_payoff(p1, p2, c, a)
-    elif abs(p2 - c) < tolerance and  p1 >= p2:
-        return plot_payoff(p1, p2, c, a)
-    elif p_m < p2:
-        if abs(p1 - p_m) < tolerance:
-            return plot_payoff(p_m, p2, c, a)
-
-def update(frame, initial_a, initial_c, dot_size, p_1_points, p_2_points, P1, P2, ax3d_1, ax3d_2, ax_scatter, surf1, surf2, sc1, sc2, sc3, sc4):
-    a = initial_a  # Constant a term
-    c = initial_c + frame * 1  # Varying 'c' term
-    if c >= a:
-        c = a
-
-    # Loop through all points in the payoff surface
-    best_response_values_1 = [[],[],[]]
-    best_response_values_2 = [[],[],[]]
-    for p_1 in p_1_points:
-        for p_2 in p_2_points:
-            res_1 = plot_best_response(p_1, p_2, c, a)
-            if res_1 is not None:
-                best_response_values_1[0].append(p_1)
-                best_response_values_1[1].append(p_2)
-                best_response_values_1[2].append(res_1)
-            
-            res_2 = plot_best_response(p_2, p_1, c, a)
-            if res_2 is not None:
-                best_response_values_2[0].append(p_1)
-                best_response_values_2[1].append(p_2)
-                best_response_values_2[2].append(res_2)
-
-    # Update Player 1 plots
-    payoff_values_1 = np.vectorize(plot_payoff)(P1, P2, c, a)
-    # Update Player 2 plots
-    payoff_values_2 = np.vectorize(plot_payoff)(P2, P1, c, a)
-
-    ax3d_1.clear()
-    ax3d_1.plot_surface(P1, P2, payoff_values_1, cmap='viridis', edgecolor='k', alpha=0.7, label='Payoff Player 1')
-    ax3d_1.scatter(best_response_values_1[0], best_response_values_1[1], best_response_values_1[2], color='red', s=dot_size, label='Best Response Player 1', depthshade=False)
-    ax3d_1.set_xlabel('P1')
-    ax3d_1.set_ylabel('P2')
-    ax3d_1.set_zlabel('Payoff')
-    ax3d_1.set_title(f'Payoff and Best Response Player 1 (a={a}, c={c})')
-
-    ax3d_2.clear()
-    ax3d_2.plot_surface(P1, P2, payoff_values_2, cmap='plasma', edgecolor='k', alpha=0.7, label='Payoff Player 2')
-    ax3d_2.scatter(best_response_values_2[0], best_response_values_2[1], best_response_values_2[2], color='blue', s=dot_size, label='Best Response Player 2', depthshade=False)
-    ax3d_2.set_xlabel('P1')
-    ax3d_2.set_ylabel('P2')
-    ax3d_2.set_zlabel('Payoff')
-    ax3d_2.set_title(f'Payoff and Best Response Player 2 (a={a}, c={c})')
-    
-    # Update scatter plot
-    ax_scatter.clear()
-    ax_scatter.scatter(best_response_values_1[0], best_response_values_1[1], c=best_response_values_1[2], s=dot_size, cmap='Reds', label='Best Response Player 1')
-    ax_scatter.scatter(best_response_values_2[0], best_response_values_2[1], c=best_response_values_2[2], s=dot_size, cmap='Blues', label='Best Response Player 2')
-    ax_scatter.set_xlabel('P1')
-    ax_scatter.set_ylabel('P2')
-    ax_scatter.set_xlim(0, P1.max())
-    ax_scatter.set_ylim(0, P2.max())
-    ax_scatter.set_title(f'Best Response Values Scatter Plot (a={a}, c={c})')
-
-def bertrand_game(a, c, animate):
-    animate = animate.lower() in {'true', '1', 't'}
-
-    if a <= c:
-        print('a must be greater than c')
-        exit()
+    return np.linspace(0, 4*p_m, num_points)
+
+def compute(a, c, num_points=100, frame=0, adaptive=False, discrete=False):
+    # The grid and the data of one frame, as drawn by create_figure. With
+    # discrete, best responses and the equilibrium are those of the game
+    # restricted to the grid (see src/matrix_solver.py).
+    p_points = grid(a, c, num_points)
+    if adaptive:
+        frame_data = next(adaptive_frames(a, c, p_points[-1], num_points, 1, frame))
+    else:
+        frame_data = next(cached_frames(a, c, p_points, 1, frame))
+    if discrete:
+        frame_data = matrix_solver.discrete_frame(frame_data, plot_payoff, p_points)
+    return p_points, frame_data
+
+def make_renderer(fig, p_points, adaptive=False, detail='medium'):
+    from src.plotting import BUDGETS, AdaptiveRenderer, GameRenderer
 
     dot_size = 10
-    num_points = 100
+    return (AdaptiveRenderer if adaptive else GameRenderer)(fig, p_points, p_points, ('P1', 'P2'), dot_size=dot_size, budget=BUDGETS[detail])
 
-    p_m = 1/2 * (a + c)
-    p_1_points = np.linspace(0, 4*p_m, num_points)
-    p_2_points = np.linspace(0, 4*p_m, num_points)
-
-    # Loop through all points in the payoff surface
-    best_response_values_1 = [[],[],[]]
-    best_response_values_2 = [[],[],[]]
-    for p_1 in p_1_points:
-        for p_2 in p_2_points:
-            res_1 = plot_best_response(p_1, p_2, c, a)
-            if res_1 is not None:
-                best_response_values_1[0].append(p_1)
-                best_response_values_1[1].append(p_2)
-                best_response_values_1[2].append(res_1)
-            
-            res_2 = plot_best_response(p_2, p_1, c, a)
-            if res_2 is not None:
-                best_response_values_2[0].append(p_1)
-                best_response_values_2[1].append(p_2)
-                best_response_values_2[2].append(res_2)
-    
-    # Generate points for the payoff surface
-    P1, P2 = np.meshgrid(p_1_points, p_2_points)
-    # Player 1
-    payoff_values_1 = np.vectorize(plot_payoff)(P1, P2, c, a)                
-    # Player 2
-    payoff_values_2 = np.vectorize(plot_payoff)(P2, P1, c, a)
+def create_figure(a, c, adaptive=False, num_points=100, detail='medium', discrete=False):
+    # Figure with the first frame drawn, the function that draws a frame, a
+    # source of frames for any [start, stop) slice and the frame count. With
+    # discrete, the best responses and equilibrium drawn are those of the
+    # game restricted to the grid, as in compute().
+    import matplotlib.pyplot as plt
+    from src.plotting import BUDGETS, sample_limit
+
+    p_points = grid(a, c, num_points)
 
     # Create a 3D plot
     fig = plt.figure(figsize=(12, 10))
-
-    # Plot payoff values and best response values for Player 1
-    ax3d_1 = fig.add_subplot(221, projection='3d')
-    surf1 = ax3d_1.plot_surface(P1, P2, payoff_values_1, cmap='viridis', edgecolor='k', alpha=0.5, label='Payoff Player 1')
-    sc1 = ax3d_1.scatter(best_response_values_1[0], best_response_values_1[1], best_response_values_1[2], color='red', s=dot_size, label='Best Response Player 1', depthshade=False)
-    ax3d_1.set_xlabel('P1')
-    ax3d_1.set_ylabel('P2')
-    ax3d_1.set_zlabel('Payoff')
-    ax3d_1.set_title('Payoff and Best Response Player 1')
-
-    # Plot payoff values and best response values for Player 2
-    ax3d_2 = fig.add_subplot(222, projection='3d')
-    surf2 = ax3d_2.plot_surface(P1, P2, payoff_values_2, cmap='plasma', edgecolor='k', alpha=0.5, label='Payoff Player 2')
-    sc2 = ax3d_2.scatter(best_response_values_2[0], best_response_values_2[1], best_response_values_2[2], color='blue', s=dot_size, label='Best Response Player 2', depthshade=False)
-    ax3d_2.set_xlabel('P1')
-    ax3d_2.set_ylabel('P2')
-    ax3d_2.set_zlabel('Payoff')
-    ax3d_2.set_title('Payoff and Best Response Player 2')
-
-    # Plot best response values for Player 1 and Player 2
-    ax_scatter = fig.add_subplot(212)
-    sc3 = ax_scatter.scatter(best_response_values_1[0], best_response_values_1[1], c=best_response_values_1[2], s=dot_size, cmap='Reds', label='Best Response Player 1')
-    sc4 = ax_scatter.scatter(best_response_values_2[0], best_response_values_2[1], c=best_response_values_2[2], s=dot_size, cmap='Blues', label='Best Response Player 2')
-    ax_scatter.set_xlabel('P1')
-    ax_scatter.set_ylabel('P2')
-    ax_scatter.set_title('Best Response Values Scatter Plot')
-    # Add a colorbar for the scatter plot
-    cbar = fig.colorbar(sc3, ax=ax_scatter, label='Payoff')
-    cbar = fig.colorbar(sc4, ax=ax_scatter, label='Payoff')
+    if adaptive:
+        max_samples = sample_limit(BUDGETS[detail], num_points)
+        frame_source = lambda start, stop: adaptive_frames(a, c, p_points[-1], num_points, stop - start, start, max_samples)
+    else:
+        frame_source = lambda start, stop: cached_frames(a, c, p_points, stop - start, start)
+    if discrete:
+        continuous_source = frame_source
+        frame_source = lambda start, stop: (matrix_solver.discrete_frame(frame_data, plot_payoff, p_points)
+                                            for frame_data in continuous_source(start, stop))
+    renderer = make_renderer(fig, p_points, adaptive, detail)
+    renderer.draw(*next(frame_source(0, 1)))
     
     # Adjust layout
     plt.tight_layout()
 
+    return fig, partial(update, renderer=renderer), frame_source, frame_count(a, c)
+
+def bertrand_game(a, c, animate, adaptive=False, detail='medium', discrete=False):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from src.plotting import supports_blit
+
+    animate = animate.lower() in {'true', '1', 't'}
+
+    if a <= c:
+        print('a must be greater than c')
+        exit()
+
+    with profiling.stage('create_figure'):
+        fig, draw, frame_source, num_frames = create_figure(a, c, adaptive, detail=detail, discrete=discrete)
+    profiling.instrument_figure(fig)
+
     # Animate the plots
-    num_frames = a - c
     print(f"Number of frames: {num_frames}")
     if animate:
-        animation = FuncAnimation(fig, update, frames=int(num_frames), interval=50, repeat=True, fargs=(a, c, dot_size, p_1_points, p_2_points, P1, P2, ax3d_1, ax3d_2, ax_scatter, surf1, surf2, sc1, sc2, sc3, sc4))
+        animation = FuncAnimation(fig, draw, frames=lambda: profiling.frames(frame_source(0, num_frames)), init_func=lambda: draw(next(frame_source(0, 1))), save_count=num_frames,
+                                  cache_frame_data=False, interval=50, repeat=True, blit=supports_blit(fig))
 
     # Show the plot
-    plt.show()
\ No newline at end of file
+    plt.show()
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from src import profiling
+from src.solvers import Segment, swap_players
+
+# Content-addressed on-disk cache of computed arrays.
+#
+# An entry is a directory named by the SHA-256 of the code version (a hash of
+# every module in src/), a namespace and the inputs. Large arrays are stored
+# as .npy files and loaded memory-mapped; small ones share one .npz. Entries
+# are written to a temporary directory and renamed into place, so concurrent
+# writers (export workers, the server) never see half an entry. A load
+# touches the entry's directory, and once the cache grows past its cap the
+# least recently used entries are removed until it is back under 90% of it.
+# Every process rescans the directory after writing a twentieth of the cap,
+# so several writers together overshoot it by at most that much each.
+# Temporary directories left behind by a killed writer count as entries
+# once they are an hour old, and are evicted first.
+#
+# The location and cap come from GAME_THEORY_CACHE and GAME_THEORY_CACHE_MB.
+
+ROOT = os.environ.get('GAME_THEORY_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'game_theory'))
+MAX_BYTES = int(float(os.environ.get('GAME_THEORY_CACHE_MB', 1024)) * 2 ** 20)
+STALE_SECONDS = 3600
+
+_enabled = True
+_code_version = None
+_usage = None
+_written = 0
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def enabled():
+    return _enabled
+
+def code_version():
+    # Any change to the package's source gives new keys
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        source = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(source)):
+            if name.endswith('.py'):
+                with open(os.path.join(source, name), 'rb') as f:
+                    digest.update(name.encode() + b'\0' + f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def key(namespace, *parts):
+    # Arrays are hashed by dtype, shape and contents, anything else by repr
+    digest = hashlib.sha256(f'{code_version()}\0{namespace}'.encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f'\0{part.dtype.str}{part.shape}'.encode() + np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(f'\0{part!r}'.encode())
+    return digest.hexdigest()
+
+def _path(entry_key):
+    return os.path.join(ROOT, entry_key[:2], entry_key)
+
+def load(entry_key):
+    # {name: array} of an entry, or None if it is not cached
+    path = _path(entry_key)
+    try:
+        names = os.listdir(path)
+        os.utime(path)
+        arrays = {}
+        for name in names:
+            if name.endswith('.npy'):
+                arrays[name[:-4]] = np.load(os.path.join(path, name), mmap_mode='r')
+            elif name.endswith('.npz'):
+                with np.load(os.path.join(path, name)) as f:
+                    arrays.update(f)
+        return arrays
+    except (OSError, ValueError):
+        # Missing, or evicted by another process while being read
+        return None
+
+def store(entry_key, arrays, small=None):
+    # arrays become .npy files, the small ones go into a single .npz
+    path = _path(entry_key)
+    if os.path.exists(path):
+        return
+    os.makedirs(ROOT, exist_ok=True)
+    temporary = tempfile.mkdtemp(prefix='tmp-', dir=ROOT)
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(temporary, name + '.npy'), values)
+        if small:
+            np.savez(os.path.join(temporary, 'small.npz'), **small)
+        size = sum(entry.stat().st_size for entry in os.scandir(temporary))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.rename(temporary, path)
+    except OSError:
+        # Another process stored the same entry first, or the disk is full
+        shutil.rmtree(temporary, ignore_errors=True)
+        return
+    _account(size)
+
+def _entry(path):
+    return os.stat(path).st_mtime, sum(f.stat().st_size for f in os.scandir(path)), path
+
+def entries():
+    # (last use, size in bytes, path) of every entry, and of temporary
+    # directories abandoned by writers that died
+    if not os.path.isdir(ROOT):
+        return
+    stale = time.time() - STALE_SECONDS
+    for prefix in os.scandir(ROOT):
+        try:
+            if prefix.name.startswith('tmp-') and prefix.stat().st_mtime < stale:
+                yield _entry(prefix.path)
+            if not prefix.is_dir() or len(prefix.name) != 2:
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    yield _entry(entry.path)
+                except OSError:
+                    continue
+        except OSError:
+            # Renamed or removed by another process meanwhile
+            continue
+
+def _account(size):
+    # Track the cache size from a scan, redone after every MAX_BYTES / 20
+    # this process writes to take in what other processes wrote, and evict
+    # past the cap
+    global _usage, _written
+    _written += size
+    if _usage is None or _written >= MAX_BYTES // 20:
+        _usage = sum(size for _, size, _ in entries())
+        _written = 0
+    else:
+        _usage += size
+    if _usage > MAX_BYTES:
+        evict(int(MAX_BYTES * 0.9))
+
+def evict(max_bytes):
+    # Remove least recently used entries until at most max_bytes remain,
+    # from a fresh scan
+    global _usage
+    listing = sorted(entries())
+    total = sum(size for _, size, _ in listing)
+    for _, size, path in listing:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+    _usage = total
+
+def clear():
+    global _usage, _written
+    shutil.rmtree(ROOT, ignore_errors=True)
+    _usage, _written = None, 0
+
+def store_frame(entry_key, frame_data):
+    # A symmetric game's frame: Player 1's surface as .npy, the rest small.
+    # Player 2's surface and best response are rebuilt from Player 1's.
+    a, c, payoff_values_1, payoff_values_2, best_response_1, best_response_2, nash = frame_data
+    small = {'params': np.array([a, c], dtype=float), 'nash': np.array(nash, dtype=float),
+             'attained': np.array([s.attained for s in best_response_1])}
+    for k, s in enumerate(best_response_1):
+        small[f'segment_{k}'] = np.stack([s.x, s.y, s.z])
+    store(entry_key, {'payoff_1': payoff_values_1}, small)
+
+def load_frame(entry_key):
+    arrays = load(entry_key)
+    if arrays is None:
+        return None
+    try:
+        a, c = arrays['params'].tolist()
+        best_response_1 = [Segment(*arrays[f'segment_{k}'], bool(attained)) for k, attained in enumerate(arrays['attained'])]
+        payoff_values_1 = arrays['payoff_1']
+    except KeyError:
+        # Listed while another process was evicting it, some files were gone
+        return None
+    return a, c, payoff_values_1, payoff_values_1.T, best_response_1, swap_players(best_response_1), tuple(arrays['nash'].tolist())
+
+def frames(game, points, frame_params, compute):
+    # A game's animation frames, loaded where cached. frame_params are the
+    # (a, c) of every frame and compute(i) yields the frames from the i-th on;
+    # from the first frame missing, the rest are computed in their usual
+    # batches and stored.
+    if not _enabled:
+        yield from compute(0)
+        return
+    generator = None
+    for i, (a, c) in enumerate(frame_params):
+        frame_key = key(game, float(a), float(c), points)
+        frame_data = None
+        if generator is None:
+            with profiling.stage('cache_load'):
+                frame_data = load_frame(frame_key)
+        if frame_data is None:
+            generator = generator or compute(i)
+            frame_data = next(generator)
+            store_frame(frame_key, frame_data)
+        yield frame_data
@@ -1,154 +1,120 @@
+from functools import partial
+
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.animation import FuncAnimation
-from matplotlib.colors import LinearSegmentedColormap
+from src import adaptive, cache, kernels, matrix_solver, oligopoly, profiling, solvers
 
 def plot_payoff(q1, q2, c, a):
-    p = 0
-    if (q1 + q2) <= a:
-        p = q1 * (a - c - q1 - q2)
-    return p if p >= 0 else 0
-
-def plot_best_response(q1, q2, c, a):
-    best_response = 1/2 * (a - c - q2)
-
-    tolerance = 1e-1
-    if abs(q1 - best_response) < tolerance:
-        return plot_payoff(q1, q2, c, a)
+    return kernels.cournot_payoff(q1, q2, c, a)
+
+def plot_best_response(a, c, q_max, num_points):
+    # Player 1's best response curve, Player 2's is the same with the axes swapped
+    best_response_1 = solvers.cournot_best_response(a, c, q_max, num_points)
+    return best_response_1, solvers.swap_players(best_response_1)
+
+def frames(initial_a, initial_c, q_points, num_frames, start=0):
+    # Payoff surfaces for the whole 'c' sweep, computed in batches of frames
+    # rather than one grid cell at a time
+    a_frames, c_frames = kernels.frame_params(initial_a, initial_c, num_frames, start)
+    for (c, a), payoff_values_1, payoff_values_2 in kernels.sweep_surfaces(plot_payoff, q_points, (c_frames, a_frames)):
+        with profiling.stage('best_response'):
+            best_response_1, best_response_2 = plot_best_response(a, c, q_points[-1], len(q_points))
+        yield a, c, payoff_values_1, payoff_values_2, best_response_1, best_response_2, solvers.cournot_nash(a, c)
+
+def cached_frames(initial_a, initial_c, q_points, num_frames, start=0):
+    # frames() through the on-disk cache (see src/cache.py)
+    a_frames, c_frames = kernels.frame_params(initial_a, initial_c, num_frames, start)
+    return cache.frames('cournot', q_points, zip(a_frames, c_frames),
+                        lambda i: frames(initial_a, initial_c, q_points, num_frames - i, start + i))
+
+def adaptive_frames(initial_a, initial_c, q_max, num_points, num_frames, start=0, max_samples=None):
+    # Same frames as frames() with adaptively refined payoff samples, dense
+    # along Player 1's best response and the kinks of the payoff surface.
+    # Cells get no finer than a grid of num_points, and there are at most
+    # max_samples samples (default num_points ** 2).
+    a_frames, c_frames = kernels.frame_params(initial_a, initial_c, num_frames, start)
+    for a, c in zip(a_frames, c_frames):
+        with profiling.stage('adaptive_refine'):
+            samples_1 = adaptive.refine(lambda q1, q2: plot_payoff(q1, q2, c, a), q_max, q_max, *adaptive.levels(num_points),
+                                        max_samples=max_samples or num_points ** 2,
+                                        features=[lambda q1, q2: q1 - oligopoly.cournot_best_response(a, c, q2)])
+        best_response_1, best_response_2 = plot_best_response(a, c, q_max, num_points)
+        yield a, c, samples_1, adaptive.swap_players(samples_1), best_response_1, best_response_2, solvers.cournot_nash(a, c)
+
+def frame_count(a, c):
+    return int(a - c)
+
+def update(frame_data, renderer):
+    with profiling.stage('update'):
+        return renderer.draw(*frame_data)
+
+def grid(a, c, num_points):
+    return np.linspace(0, a-c, num_points)
+
+def compute(a, c, num_points=300, frame=0, adaptive=False, discrete=False):
+    # The grid and the data of one frame, as drawn by create_figure. With
+    # discrete, best responses and the equilibrium are those of the game
+    # restricted to the grid (see src/matrix_solver.py).
+    q_points = grid(a, c, num_points)
+    if adaptive:
+        frame_data = next(adaptive_frames(a, c, q_points[-1], num_points, 1, frame))
     else:
-        return np.nan
-
-def update(frame, initial_a, initial_c, Q1, Q2, dot_size, ax3d_1, ax3d_2, ax_scatter, surf1, surf2, sc1, sc2, sc3, sc4):
-    a = initial_a # Constant a term
-    c = initial_c + frame * 1 # Varying 'c' term
-    if c >= a:
-        c = a
-    
-    # Update Player 1 plots
-    payoff_values_1 = np.vectorize(plot_payoff)(Q1, Q2, c, a)
-    best_response_values_1 = np.vectorize(plot_best_response)(Q1, Q2, c, a)
-
-    surf1.set_array(payoff_values_1.flatten())
-    sc1.set_array(best_response_values_1.flatten())
-    
-    contour_levels_1 = np.linspace(np.nanmin(payoff_values_1), np.nanmax(payoff_values_1), 25)
-    ax3d_1.clear()
-    ax3d_1.plot_surface(Q1, Q2, payoff_values_1, cmap='viridis', edgecolor='k', alpha=0.7, label='Payoff Player 1')
-    ax3d_1.scatter(Q1, Q2, best_response_values_1, color='red', s=dot_size, label='Best Response Player 1', depthshade=False)
-    ax3d_1.contour(Q1, Q2, payoff_values_1, zdir='z', offset=ax3d_1.get_zlim()[0], levels=contour_levels_1, cmap='viridis', alpha=0.5)
-    ax3d_1.set_zlim(0, np.nanmax(payoff_values_1))  # Set z-axis limit for Player 1
-    ax3d_1.set_xlabel('Q1')
-    ax3d_1.set_ylabel('Q2')
-    ax3d_1.set_zlabel('Payoff')
-    ax3d_1.set_title(f'Payoff and Best Response Player 1 (a={a}, c={c})')
-
-    # Update Player 2 plots
-    payoff_values_2 = np.vectorize(plot_payoff)(Q2, Q1, c, a)
-    best_response_values_2 = np.vectorize(plot_best_response)(Q2, Q1, c, a)
-    
-    surf2.set_array(payoff_values_2.flatten())
-    sc2.set_array(best_response_values_2.flatten())
-    
-    contour_levels_2 = np.linspace(np.nanmin(payoff_values_2), np.nanmax(payoff_values_2), 10)
-    ax3d_2.clear()
-    ax3d_2.plot_surface(Q1, Q2, payoff_values_2, cmap='viridis', edgecolor='k', alpha=0.7, label='Payoff Player 2')
-    ax3d_2.scatter(Q1, Q2, best_response_values_2, color='blue', s=dot_size, label='Best Response Player 2', depthshade=False)
-    ax3d_2.contour(Q1, Q2, payoff_values_2, zdir='z', offset=ax3d_2.get_zlim()[0], levels=contour_levels_2, cmap='viridis', alpha=0.5)
-    ax3d_2.set_zlim(0, np.nanmax(payoff_values_2))  # Set z-axis limit for Player 2
-    ax3d_2.set_xlabel('Q1')
-    ax3d_2.set_ylabel('Q2')
-    ax3d_2.set_zlabel('Payoff')
-    ax3d_2.set_title(f'Payoff and Best Response Player 2 (a={a}, c={c})')
-
-    sc3.set_array(best_response_values_1.flatten())
-    sc4.set_array(best_response_values_2.flatten())
-    
-    contour_levels_scatter = np.linspace(np.nanmin(payoff_values_1), np.nanmax(payoff_values_1), 10)
-    ax_scatter.clear()
-    ax_scatter.scatter(Q1.flatten(), Q2.flatten(), c=best_response_values_1.flatten(), s=dot_size, cmap='viridis', label='Best Response Player 1', alpha=0.7)
-    ax_scatter.scatter(Q1.flatten(), Q2.flatten(), c=best_response_values_2.flatten(), s=dot_size, cmap='viridis', label='Best Response Player 2', alpha=0.7)
-    ax_scatter.set_xlabel('Q1')
-    ax_scatter.set_ylabel('Q2')
-    
-    # Set fixed axis limits
-    ax_scatter.set_xlim(0, Q1.max())
-    ax_scatter.set_ylim(0, Q2.max())
-
-    contour_levels_scatter = np.linspace(np.nanmin(payoff_values_1), np.nanmax(payoff_values_1), 10)
-    ax_scatter.contour(Q1, Q2, payoff_values_1, levels=contour_levels_scatter, colors='black', alpha=0.5)
-    ax_scatter.set_title(f'Best Response Values Scatter Plot (a={a}, c={c})')
-
-def cournot_game(a, c, animate):
-    animate = animate.lower() in {'true', '1', 't'}
-    
-    # Generate points for the payoff surface
-    dot_size = 10
-    num_points = 300
-
-    Q1, Q2 = np.meshgrid(np.linspace(0, a-c, num_points), np.linspace(0, a-c, num_points))
+        frame_data = next(cached_frames(a, c, q_points, 1, frame))
+    if discrete:
+        frame_data = matrix_solver.discrete_frame(frame_data, plot_payoff, q_points)
+    return q_points, frame_data
 
-    # Player 1
-    payoff_values_1 = np.vectorize(plot_payoff)(Q1, Q2, c, a)
-    best_response_values_1 = np.vectorize(plot_best_response)(Q1, Q2, c, a)
-    # Player 2
-    payoff_values_2 = np.vectorize(plot_payoff)(Q2, Q1, c, a)
-    best_response_values_2 = np.vectorize(plot_best_response)(Q2, Q1, c, a)
+def make_renderer(fig, q_points, adaptive=False, detail='medium'):
+    # 3D plots with isoprofit curves under both surfaces and over the best
+    # responses
+    from src.plotting import BUDGETS, AdaptiveRenderer, GameRenderer
 
-    # Create a 3D plot
+    dot_size = 10
+    renderer_class = AdaptiveRenderer if adaptive else GameRenderer
+    return renderer_class(fig, q_points, q_points, ('Q1', 'Q2'), surface_cmaps=('viridis', 'viridis'), best_response_cmaps=('viridis', 'viridis'),
+                          alpha=0.7, dot_size=dot_size, contour_levels=(25, 10, 10), zlim_from_zero=True, budget=BUDGETS[detail])
+
+def create_figure(a, c, adaptive=False, num_points=300, detail='medium', discrete=False):
+    # Figure with the first frame drawn, the function that draws a frame, a
+    # source of frames for any [start, stop) slice and the frame count. With
+    # discrete, the best responses and equilibrium drawn are those of the
+    # game restricted to the grid, as in compute().
+    import matplotlib.pyplot as plt
+    from src.plotting import BUDGETS, sample_limit
+
+    q_points = grid(a, c, num_points)
     fig = plt.figure(figsize=(12, 10))
-
-    # Plot payoff values and best response values for Player 1
-    ax3d_1 = fig.add_subplot(221, projection='3d')
-    surf1 = ax3d_1.plot_surface(Q1, Q2, payoff_values_1, cmap='viridis', edgecolor='k', alpha=0.7, label='Payoff Player 1')
-    sc1 = ax3d_1.scatter(Q1, Q2, best_response_values_1, color='red', s=dot_size, label='Best Response Player 1', depthshade=False)
-    ax3d_1.set_zlim(0, np.nanmax(payoff_values_1))  # Set z-axis limit for Player 1
-    ax3d_1.set_xlabel('Q1')
-    ax3d_1.set_ylabel('Q2')
-    ax3d_1.set_zlabel('Payoff')
-    ax3d_1.set_title('Payoff and Best Response Player 1')
-
-    # Add isoprofit curves for Player 1
-    contour_levels_1 = np.linspace(np.nanmin(payoff_values_1), np.nanmax(payoff_values_1), 25)
-    ax3d_1.contour(Q1, Q2, payoff_values_1, zdir='z', offset=ax3d_1.get_zlim()[0], levels=contour_levels_1, cmap='viridis', alpha=0.5)
-
-    # Plot payoff values and best response values for Player 2
-    ax3d_2 = fig.add_subplot(222, projection='3d')
-    surf2 = ax3d_2.plot_surface(Q1, Q2, payoff_values_2, cmap='viridis', edgecolor='k', alpha=0.7, label='Payoff Player 2')
-    sc2 = ax3d_2.scatter(Q1, Q2, best_response_values_2, color='blue', s=dot_size, label='Best Response Player 2', depthshade=False)
-    ax3d_2.set_zlim(0, np.nanmax(payoff_values_2))  # Set z-axis limit for Player 2
-    ax3d_2.set_xlabel('Q1')
-    ax3d_2.set_ylabel('Q2')
-    ax3d_2.set_zlabel('Payoff')
-    ax3d_2.set_title('Payoff and Best Response Player 2')
-
-    # Add isoprofit curves for Player 2
-    contour_levels_2 = np.linspace(np.nanmin(payoff_values_2), np.nanmax(payoff_values_2), 10)
-    ax3d_2.contour(Q1, Q2, payoff_values_2, zdir='z', offset=ax3d_2.get_zlim()[0], levels=contour_levels_2, cmap='viridis', alpha=0.5)
-
-    # Plot best response values for Player 1 and Player 2
-    ax_scatter = fig.add_subplot(212)
-    sc3 = ax_scatter.scatter(Q1.flatten(), Q2.flatten(), c=best_response_values_1.flatten(), s=dot_size, cmap='viridis', label='Best Response Player 1', alpha=0.7)
-    sc4 = ax_scatter.scatter(Q1.flatten(), Q2.flatten(), c=best_response_values_2.flatten(), s=dot_size, cmap='viridis', label='Best Response Player 2', alpha=0.7)
-    ax_scatter.set_xlabel('Q1')
-    ax_scatter.set_ylabel('Q2')
-    ax_scatter.set_title('Best Response Values Scatter Plot')
-    # Add a colorbar for the scatter plot
-    cbar = fig.colorbar(sc3, ax=ax_scatter, label='Payoff')
-    cbar = fig.colorbar(sc4, ax=ax_scatter, label='Payoff')
-
-    # Add isoprofit curves for the scatter plot
-    contour_levels_scatter = np.linspace(np.nanmin(payoff_values_1), np.nanmax(payoff_values_1), 50)
-    ax_scatter.contour(Q1, Q2, payoff_values_1, levels=contour_levels_scatter, colors='black', alpha=0.5)
+    if adaptive:
+        max_samples = sample_limit(BUDGETS[detail], num_points)
+        frame_source = lambda start, stop: adaptive_frames(a, c, q_points[-1], num_points, stop - start, start, max_samples)
+    else:
+        frame_source = lambda start, stop: cached_frames(a, c, q_points, stop - start, start)
+    if discrete:
+        continuous_source = frame_source
+        frame_source = lambda start, stop: (matrix_solver.discrete_frame(frame_data, plot_payoff, q_points)
+                                            for frame_data in continuous_source(start, stop))
+    renderer = make_renderer(fig, q_points, adaptive, detail)
+    renderer.draw(*next(frame_source(0, 1)))
 
     # Adjust layout
     plt.tight_layout()
 
+    return fig, partial(update, renderer=renderer), frame_source, frame_count(a, c)
+
+def cournot_game(a, c, animate, adaptive=False, detail='medium', discrete=False):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from src.plotting import supports_blit
+
+    animate = animate.lower() in {'true', '1', 't'}
+    with profiling.stage('create_figure'):
+        fig, draw, frame_source, num_frames = create_figure(a, c, adaptive, detail=detail, discrete=discrete)
+    profiling.instrument_figure(fig)
+
     # Animate the plots
-    num_frames = a - c
     print(f"Number of frames: {num_frames}")
     if animate:
-        animation = FuncAnimation(fig, update, frames=int(num_frames), interval=50, repeat=True, fargs=(a, c, Q1, Q2, dot_size, ax3d_1, ax3d_2, ax_scatter, surf1, surf2, sc1, sc2, sc3, sc4))
+        animation = FuncAnimation(fig, draw, frames=lambda: profiling.frames(frame_source(0, num_frames)), init_func=lambda: draw(next(frame_source(0, 1))), save_count=num_frames,
+                                  cache_frame_data=False, interval=50, repeat=True, blit=supports_blit(fig))
 
     # Show the plot
     plt.show()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from multiprocessing import Pool
+
+from src import profiling, registry
+
+# Headless export of the game animations.
+#
+# Every worker process builds the game's figure once on the Agg backend and
+# renders a contiguous slice of the frame range to PNG. The frames are then
+# kept as an image sequence or stitched into a GIF (Pillow) or video (ffmpeg).
+
+VIDEO_FORMATS = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
+
+def frame_slices(num_frames, num_slices):
+    # Split [0, num_frames) into at most num_slices contiguous [start, stop) ranges
+    bounds = [num_frames * i // num_slices for i in range(num_slices + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+def _init_worker(profile):
+    import matplotlib
+    matplotlib.use('Agg')
+    # A forked worker starts with a copy of the parent's profile
+    if profile:
+        profiling.enable()
+    else:
+        profiling.disable()
+
+def render_frames(job):
+    game, params, options, start, stop, frame_pattern, dpi, size = job
+    import matplotlib.pyplot as plt
+
+    with profiling.stage('create_figure'):
+        fig, draw, frame_source, num_frames = registry.load(game).create_figure(*params, **options)
+    if size is not None:
+        fig.set_size_inches(size)
+        fig.tight_layout()
+    profiling.instrument_figure(fig)
+
+    paths = []
+    for i, frame_data in enumerate(profiling.frames(frame_source(start, stop), start), start):
+        draw(frame_data)
+        path = frame_pattern.format(i)
+        with profiling.stage('savefig'):
+            fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    plt.close(fig)
+    # Stage timings go back to the parent with the paths
+    return paths, profiling.take_events()
+
+def stitch_gif(paths, output, fps):
+    from PIL import Image
+
+    images = [Image.open(path) for path in paths]
+    images[0].save(output, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+
+def stitch_video(frame_pattern, output, fps):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError(f'ffmpeg is required to write {output}')
+    # Video encoders need even frame dimensions
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps), '-i', frame_pattern,
+                    '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output], check=True)
+
+def export_animation(game, params, output, workers=None, dpi=None, size=None, fps=20, options=None):
+    # output is a directory (PNG sequence), a .png file (a single frame is
+    # written as-is, several become <name>_00000.png, ...), a .gif or a video.
+    # options are extra keyword arguments for the game's create_figure.
+    import matplotlib
+    matplotlib.use('Agg')
+    num_frames = registry.load(game).frame_count(*params)
+    if num_frames < 1:
+        raise ValueError(f'{game} with parameters {params} has no frames to export')
+    workers = workers or os.cpu_count() or 1
+
+    root, ext = os.path.splitext(output)
+    ext = ext.lower()
+    stitched = ext == '.gif' or ext in VIDEO_FORMATS
+    if stitched:
+        frame_dir = tempfile.mkdtemp(prefix='frames-')
+        frame_pattern = os.path.join(frame_dir, 'frame_{:05d}.png')
+    elif ext == '.png':
+        frame_pattern = output if num_frames == 1 else root + '_{:05d}.png'
+    else:
+        os.makedirs(output, exist_ok=True)
+        frame_pattern = os.path.join(output, 'frame_{:05d}.png')
+
+    jobs = [(game, params, options or {}, start, stop, frame_pattern, dpi, size) for start, stop in frame_slices(num_frames, workers)]
+    try:
+        if len(jobs) == 1:
+            results = [render_frames(jobs[0])]
+        else:
+            with Pool(len(jobs), initializer=_init_worker, initargs=(profiling.enabled(),)) as pool:
+                results = pool.map(render_frames, jobs)
+        paths = [path for chunk, events in results for path in chunk]
+        for chunk, events in results:
+            profiling.add_events(events)
+
+        if ext == '.gif':
+            stitch_gif(paths, output, fps)
+        elif ext in VIDEO_FORMATS:
+            stitch_video(os.path.join(frame_dir, 'frame_%05d.png'), output, fps)
+    finally:
+        if stitched:
+            shutil.rmtree(frame_dir, ignore_errors=True)
+
+    print(f'Wrote {num_frames} frame(s) to {output}')
@@ -1,90 +1,124 @@
-import matplotlib.pyplot as plt
+from functools import partial
+
 import numpy as np
-from matplotlib.animation import FuncAnimation
+from src import profiling
+
+# The four edges of the prisoner's dilemma feasible payoff set animated below
+SEGMENTS = [((0, 3), (2, 2)), ((0, 3), (1, 1)), ((2, 2), (3, 0)), ((1, 1), (3, 0))]
+
+def discounted_cycle_weights(delta, num_points, num_generations=None):
+    # Weight of each position r = n % num_points of the repeating cycle in the
+    # discounted payoff, for every delta at once (shape delta.shape + (num_points,)).
+    #
+    # With num_generations this is exactly the finite sum of delta ** n over
+    # 1 <= n <= num_generations, divided by num_generations + 1 as in the
+    # original loop. Each residue class is a geometric series, so
+    #     sum_k delta ** (n0 + k * num_points) = delta ** n0 * (1 - delta ** (num_points * K)) / (1 - delta ** num_points)
+    # where n0 is the first n of the class and K the number of terms.
+    #
+    # With num_generations=None the horizon is infinite and the weights are the
+    # normalized discounted average (1 - delta) * delta ** (n - 1), which sum to 1.
+    delta = np.asarray(delta, dtype=float)[..., None]
+    r = np.arange(num_points)
+    n0 = np.where(r == 0, num_points, r)
+    period = delta ** num_points
+    # delta == 1 is the limit of the geometric series
+    undiscounted = period == 1
+    denominator = np.where(undiscounted, 1, 1 - period)
+
+    if num_generations is None:
+        weights = (1 - delta) * delta ** (n0 - 1) / denominator
+        return np.where(undiscounted, 1 / num_points, weights)
+
+    terms = np.where(n0 <= num_generations, (num_generations - n0) // num_points + 1, 0)
+    sums = np.where(undiscounted, terms, delta ** n0 * (1 - period ** terms) / denominator)
+    return sums / (num_generations + 1)
+
+def compute_segments(delta, segments, num_points, num_generations=None):
+    # Average payoffs of the cycles with num_points - i cooperations followed
+    # by i defections, for i = 0..num_points, on every segment and for every
+    # delta in one batched computation. Returns x of shape (segments, num_points + 1)
+    # and y of shape delta.shape + (segments, num_points + 1).
+    coords = np.asarray(segments, dtype=float)
+    (x1, y1), (x2, y2) = coords[:, 0].T, coords[:, 1].T
+    x_values = np.linspace(x1, x2, num_points + 1, axis=-1)
+
+    # A C (cooperate) earns the higher payoff of the segment, a D (defect) the lower
+    top_val = np.maximum(y1, y2)[:, None]
+    bot_val = np.minimum(y1, y2)[:, None]
+
+    with profiling.stage('compute_segments'):
+        weights = discounted_cycle_weights(delta, num_points, num_generations)
+        # Cumulative weight of the first num_c cycle positions, num_c = num_points - i
+        cooperate = np.concatenate([np.zeros(weights.shape[:-1] + (1,)), np.cumsum(weights, axis=-1)], axis=-1)
+        cooperate = cooperate[..., ::-1][..., None, :]
+        total = cooperate[..., :1]
+        y_values = top_val * cooperate + bot_val * (total - cooperate)
+    return x_values, y_values
 
 def compute_points(delta, left_coord, right_coord, num_points, num_generations):
-    x_values = []
-    y_values = []
-
-    x1, y1 = left_coord
-    x2, y2 = right_coord
-
-    # Split the interval [0, 1] into num_points intervals
-    partition = np.linspace(x1, x2, num_points + 1)
-    for i in range(num_points + 1):
-        num_c = num_points - i
-        num_d = i
-
-        payoff = 0
-        iterations = 0
-        n_loops = 1
-        converged = False
-        
-        for j in range(num_generations):
-            idx = n_loops % num_points
-
-            # One cycle is done
-            if idx == 0:
-                iterations += 1
-
-            top_val = y1 if y1 > y2 else y2
-            bot_val = y1 if y1 < y2 else y2
-            # We hit a C (cooperate) therefore payoff is closer to 2
-            if idx < num_c:
-                net = top_val * (delta ** n_loops)
-                payoff += net
-            # We hit a D (defect) therefore payoff is closer to 3
-            else:
-                net = bot_val * (delta ** n_loops)
-                payoff += net
-
-            n_loops += 1
-
-        avg_payoff = payoff / n_loops
-
-        # Append the coordinates for plotting
-        x_values.append(partition[i])
-        y_values.append(avg_payoff)
-
-    return x_values, y_values
+    x_values, y_values = compute_segments(delta, [(left_coord, right_coord)], num_points, num_generations)
+    return x_values[0], y_values[..., 0, :]
 
 # Animation update function
-def update(frame, ax):
-    delta = 1 - frame * 0.0001
-    num_points = 30
-    num_generations = 10000
-
-    x1, y1 = compute_points(delta, (0, 3), (2, 2), num_points, num_generations)
-    x2, y2 = compute_points(delta, (0, 3), (1, 1), num_points, num_generations)
-    x3, y3 = compute_points(delta, (2, 2), (3, 0), num_points, num_generations)
-    x4, y4 = compute_points(delta, (1, 1), (3, 0), num_points, num_generations)
-
-
-    # Update the scatter plot
-    ax.clear()
-    ax.scatter(x1, y1, s=100)
-    ax.scatter(x2, y2, s=100)
-    ax.scatter(x3, y3, s=100)
-    ax.scatter(x4, y4, s=100)
+def update(frame, scatters, label, deltas, x_values, y_values):
+    # Payoffs for every frame were computed up front by compute_segments
+    with profiling.stage('update'):
+        for scatter, x, y in zip(scatters, x_values, y_values[frame]):
+            scatter.set_offsets(np.column_stack([x, y]))
+        label.set_text(f'Delta={deltas[frame]}')
+    return scatters + [label]
+
+def frame_count():
+    return 100
+
+def compute(num_points=30, num_generations=10000):
+    # The delta of every frame and the payoffs drawn for it, see compute_segments
+    deltas = 1 - np.arange(frame_count()) * 0.0001
+    x_values, y_values = compute_segments(deltas, SEGMENTS, num_points, num_generations)
+    return deltas, x_values, y_values
+
+def make_axes(fig):
+    # The scatter axis with one (empty) scatter per segment and the label of
+    # the current delta. The label sits inside the axes rather than in the
+    # title, so blitting, which only redraws the axes, updates it too.
+    ax_scatter = fig.add_subplot(111)
+    scatters = [ax_scatter.scatter([], [], s=100) for _ in SEGMENTS]
+    label = ax_scatter.text(0.98, 0.98, '', transform=ax_scatter.transAxes, ha='right', va='top')
+    ax_scatter.set_title('Best Response Values Scatter Plot')
+    ax_scatter.set_xlabel('Number of Cooperate (C)')
+    ax_scatter.set_ylabel('Average Payoff')
 
     # Set fixed axis limits
-    ax.set_xlim(0, 3)
-    ax.set_ylim(0, 3)
-    ax.set_title(f'Best Response Values Scatter Plot (Delta={delta})')
-
-# Create a figure and axis
-fig = plt.figure(figsize=(12, 10))
-ax_scatter = fig.add_subplot(111)
-ax_scatter.scatter([1], [2], s=100, label='Best Response Player 1')
-ax_scatter.set_xlabel('Number of Cooperate (C)')
-ax_scatter.set_ylabel('Average Payoff')
-ax_scatter.set_title('Payoff vs. Number of Cooperate (C)')
-
-# Number of frames for the animation
-num_frames = 100
-
-# Create the animation
-animation = FuncAnimation(fig, update, frames=range(num_frames), repeat=False, fargs=(ax_scatter,), interval=100)
-
-# Show the animation
-plt.show()
+    ax_scatter.set_xlim(0, 3)
+    ax_scatter.set_ylim(0, 3)
+    return ax_scatter, scatters, label
+
+def create_figure(num_points=30, num_generations=10000):
+    # Figure and axis, the function that draws a frame, a source of frames for
+    # any [start, stop) slice and the frame count
+    import matplotlib.pyplot as plt
+
+    deltas, x_values, y_values = compute(num_points, num_generations)
+
+    fig = plt.figure(figsize=(12, 10))
+    ax_scatter, scatters, label = make_axes(fig)
+    draw = partial(update, scatters=scatters, label=label, deltas=deltas, x_values=x_values, y_values=y_values)
+    draw(0)
+    return fig, draw, range, frame_count()
+
+def folk_game():
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from src.plotting import supports_blit
+
+    with profiling.stage('create_figure'):
+        fig, draw, frame_source, num_frames = create_figure()
+    profiling.instrument_figure(fig)
+
+    # Create the animation
+    animation = FuncAnimation(fig, draw, frames=profiling.frames(frame_source(0, num_frames)), init_func=lambda: draw(0),
+                              repeat=False, interval=100, blit=supports_blit(fig))
+
+    # Show the animation
+    plt.show()
@@ -0,0 +1,121 @@
+import functools
+
+import numpy as np
+from src import profiling, registry
+
+# Explore a game with sliders instead of the fixed animation sweep.
+#
+# Slider events only restart a short timer; when it fires the latest slider
+# values are computed and drawn once, so dragging never queues a backlog of
+# stale recomputes. Computed frames sit in a bounded LRU cache keyed by the
+# game, its parameters and the grid size, so going back to a setting already
+# visited only costs the drawing.
+
+# (name, min, max, initial value, step) of each slider. num_points is the
+# grid size of the 3D games and the cycle length of the folk theorem game.
+# Every slider has a step, and values are snapped to it before they key the
+# cache (set_val and initial values are not snapped by the slider), so coming
+# back to a setting finds it.
+SLIDERS = {
+    'cournot': [('a', 1, 200, 50, 1), ('c', 0, 199, 1, 1), ('num_points', 10, 1000, 300, 10)],
+    'bertrand': [('a', 1, 200, 50, 1), ('c', 0, 199, 4, 1), ('num_points', 10, 1000, 100, 10)],
+    'brf': [('c', 1, 500, 100, 1), ('num_points', 10, 1000, 100, 10)],
+    'folk': [('delta', 0.5, 1, 1, 0.0001), ('num_points', 2, 200, 30, 1)],
+}
+
+def snap(value, low, step):
+    # The slider position of value, rounded so equal positions are equal floats
+    return round(low + round((value - low) / step) * step, 10)
+
+def compute_frame(game, num_points, *params, discrete=False):
+    # What one setting of the sliders draws: (grid points, frame data) for the
+    # 3D games, (x_values, y_values) of every segment for the folk theorem
+    if game == 'folk':
+        module = registry.load('folk')
+        return module.compute_segments(params[0], module.SEGMENTS, num_points, 10000)
+    options = {'discrete': True} if discrete else {}
+    return registry.compute(game, *params, num_points=num_points, **options)
+
+class InteractiveGame:
+    def __init__(self, game, initial=None, detail='medium', discrete=False, debounce=0.15, cache_size=32):
+        import matplotlib.pyplot as plt
+        from matplotlib.widgets import Slider
+
+        self.game = game
+        self.detail = detail
+        self.discrete = discrete
+        self.module = registry.load(game)
+        self.compute = functools.lru_cache(maxsize=cache_size)(compute_frame)
+        self.fig = plt.figure(figsize=(12, 11))
+        self.renderer = None
+        self.folk_axes = None
+
+        # Sliders along the bottom, the game's plots above them
+        self.sliders = {}
+        for i, (name, low, high, value, step) in enumerate(reversed(SLIDERS[game])):
+            if initial and initial.get(name) is not None:
+                value = min(max(initial[name], low), high)
+            ax = self.fig.add_axes([0.15, 0.02 + 0.035 * i, 0.65, 0.025])
+            self.sliders[name] = Slider(ax, name, low, high, valinit=value, valstep=step)
+            self.sliders[name].on_changed(self.schedule)
+        self.bottom = 0.1 + 0.035 * len(SLIDERS[game])
+
+        self.timer = self.fig.canvas.new_timer(interval=int(debounce * 1000))
+        self.timer.single_shot = True
+        self.timer.add_callback(self.refresh)
+        self.refresh()
+
+    def schedule(self, value):
+        # Every slider event restarts the countdown, only the last one computes
+        self.timer.stop()
+        self.timer.start()
+
+    def params(self):
+        values = {name: snap(self.sliders[name].val, low, step) for name, low, high, value, step in SLIDERS[self.game]}
+        num_points = int(values.pop('num_points'))
+        if self.game == 'folk':
+            return num_points, (float(values['delta']),)
+        return num_points, tuple(float(values[name]) for name in registry.PARAMS[self.game])
+
+    def refresh(self):
+        num_points, params = self.params()
+        if self.game in ('cournot', 'bertrand') and params[0] <= params[1]:
+            self.fig.suptitle('a must be greater than c')
+            self.fig.canvas.draw_idle()
+            return
+        self.fig.suptitle('')
+
+        with profiling.stage('compute'):
+            result = self.compute(self.game, num_points, *params, discrete=self.discrete)
+        with profiling.stage('redraw'):
+            if self.game == 'folk':
+                self.draw_folk(params[0], *result)
+            else:
+                self.draw_game(*result)
+        self.fig.canvas.draw_idle()
+
+    def draw_game(self, points, frame_data):
+        # The grid changes with a, c and num_points, the artists are reused
+        if self.renderer is None:
+            self.renderer = self.module.make_renderer(self.fig, points, detail=self.detail)
+            self.fig.subplots_adjust(bottom=self.bottom)
+        else:
+            self.renderer.set_grid(points, points)
+        self.renderer.draw(*frame_data)
+
+    def draw_folk(self, delta, x_values, y_values):
+        if self.folk_axes is None:
+            self.folk_axes = self.module.make_axes(self.fig)
+            self.fig.subplots_adjust(bottom=self.bottom)
+        _, scatters, label = self.folk_axes
+        for scatter, x, y in zip(scatters, x_values, y_values):
+            scatter.set_offsets(np.column_stack([x, y]))
+        label.set_text(f'Delta={delta:g}')
+
+def interactive_game(game, initial=None, detail='medium', discrete=False):
+    import matplotlib.pyplot as plt
+
+    # Keep a reference so the sliders and timer stay alive while shown
+    explorer = InteractiveGame(game, initial, detail, discrete)
+    plt.show()
+    return explorer
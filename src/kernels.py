@@ -0,0 +1,73 @@
+import numpy as np
+from src import profiling
+
+# Vectorized payoff kernels shared by all games.
+#
+# Every kernel broadcasts like a NumPy ufunc, so the strategy arguments can be
+# open grids (points[None, :], points[:, None]) and the parameters can carry
+# leading frame axes (see `expand_params`). A whole animation sweep is then a
+# single (frames x grid x grid) array computation, done in batches of about
+# BLOCK_CELLS cells so memory does not grow with the number of frames.
+
+BLOCK_CELLS = 2 ** 22
+
+def cournot_payoff(q1, q2, c, a):
+    q1, q2 = np.asarray(q1, dtype=float), np.asarray(q2, dtype=float)
+    p = q1 * (a - c - q1 - q2)
+    return np.where(q1 + q2 <= a, np.maximum(p, 0), 0.0)
+
+def bertrand_payoff(p1, p2, c, a):
+    p1, p2 = np.asarray(p1, dtype=float), np.asarray(p2, dtype=float)
+    p = (p1 - c) * (a - p1)
+    # The lower price takes the whole market, a tie splits it
+    return np.where(p1 > p2, 0.0, np.where(p1 == p2, 1/2 * p, p))
+
+def brf_payoff(a1, a2, c):
+    a1, a2 = np.asarray(a1, dtype=float), np.asarray(a2, dtype=float)
+    return a1 * (c + a2 - a1)
+
+def expand_params(*params, ndim=2):
+    # Give scalar or 1-D parameter sweeps trailing axes so they broadcast
+    # against an ndim-dimensional grid: c of shape (frames,) -> (frames, 1, 1)
+    return tuple(np.asarray(p, dtype=float).reshape(np.shape(p) + (1,) * ndim) for p in params)
+
+def open_grid(x_points, y_points=None):
+    # Broadcasting equivalent of np.meshgrid(x_points, y_points) without
+    # materializing either array
+    y_points = x_points if y_points is None else y_points
+    return np.asarray(x_points)[None, :], np.asarray(y_points)[:, None]
+
+def symmetric_surfaces(kernel, points, *params):
+    # Payoff surfaces for both players of a symmetric game on the square grid
+    # np.meshgrid(points, points). Player 2's payoff kernel(Y, X) is exactly
+    # the transpose of Player 1's, so it is returned as a view rather than
+    # computed a second time. Parameters may be frame sweeps.
+    X, Y = open_grid(points)
+    payoff_1 = kernel(X, Y, *expand_params(*params))
+    payoff_2 = payoff_1.swapaxes(-1, -2)
+    return payoff_1, payoff_2
+
+def frame_params(initial_a, initial_c, num_frames, start=0):
+    # The animations keep 'a' fixed and raise 'c' by one per frame until it
+    # reaches 'a'
+    c = np.minimum(initial_c + np.arange(start, start + num_frames, dtype=float), initial_a)
+    return np.full_like(c, initial_a), c
+
+def frame_batch_size(num_points, block_cells=BLOCK_CELLS, max_frames=32):
+    # Frames per batch so a batch has about block_cells grid cells
+    return min(max(block_cells // (num_points * num_points), 1), max_frames)
+
+def sweep_surfaces(kernel, points, params, batch_size=None):
+    # Evaluate the symmetric surfaces for a whole parameter sweep, batch_size
+    # frames per array computation (by default sized by frame_batch_size), and
+    # yield them one frame at a time. Each entry of params is a per-frame
+    # array in the kernel's argument order.
+    params = [np.asarray(p, dtype=float) for p in params]
+    num_frames = len(params[0])
+    batch_size = batch_size or frame_batch_size(len(points))
+    for start in range(0, num_frames, batch_size):
+        batch = [p[start:start + batch_size] for p in params]
+        with profiling.stage('payoff_surfaces'):
+            payoff_1, payoff_2 = symmetric_surfaces(kernel, points, *batch)
+        for i in range(len(batch[0])):
+            yield tuple(p[i] for p in batch), payoff_1[i], payoff_2[i]
@@ -0,0 +1,151 @@
+from collections import namedtuple
+
+import numpy as np
+from src import kernels, registry
+from src.solvers import Segment
+
+# Best responses and pure Nash equilibria of a game restricted to a discrete
+# grid of actions, i.e. of its bimatrix.
+#
+# The payoff matrix is never held whole. Blocks of rows (the opponent's
+# actions) are evaluated a column tile at a time, twice: the first pass keeps
+# each row's running maximum, the second marks every action within tol of it.
+# A best response set is stored as runs of consecutive grid indices, so rows
+# where many actions tie (zero profit once the rival floods the market, say)
+# cost one run rather than one entry per action. Memory is bounded by the
+# block and tile sizes whatever the grid.
+#
+# Pure equilibria are the pairs where each action is in the other player's
+# best response set; candidates are checked in batches against the runs.
+
+BLOCK_CELLS = 2 ** 22
+
+# Runs of best responses sorted by row: own actions start..stop - 1 are best
+# responses to the opponent's action row
+Responses = namedtuple('Responses', ['row', 'start', 'stop', 'num_rows', 'num_cols'])
+
+Solution = namedtuple('Solution', ['points', 'responses', 'best_response_1', 'best_response_2', 'equilibria'])
+
+def _blocks(num_rows, num_cols, block_cells):
+    # Row blocks and column tiles of about block_cells cells each
+    tile = min(num_cols, max(int(np.sqrt(block_cells)), 1))
+    rows = max(block_cells // tile, 1)
+    row_blocks = [slice(r, min(r + rows, num_rows)) for r in range(0, num_rows, rows)]
+    col_tiles = [slice(c, min(c + tile, num_cols)) for c in range(0, num_cols, tile)]
+    return row_blocks, col_tiles
+
+def best_response_sets(payoff, own_points, other_points, tol=1e-9, block_cells=BLOCK_CELLS):
+    # payoff(own, other) broadcasting like the kernels. An action is a best
+    # response if its payoff is within tol (relative) of the row's maximum.
+    own_points = np.asarray(own_points, dtype=float)
+    other_points = np.asarray(other_points, dtype=float)
+    num_rows, num_cols = len(other_points), len(own_points)
+    row_blocks, col_tiles = _blocks(num_rows, num_cols, block_cells)
+
+    runs = []
+    for rows in row_blocks:
+        best = np.full(rows.stop - rows.start, -np.inf)
+        for cols in col_tiles:
+            X, Y = kernels.open_grid(own_points[cols], other_points[rows])
+            best = np.maximum(best, payoff(X, Y).max(axis=1))
+        threshold = (best - tol * np.abs(best))[:, None]
+
+        # Run boundaries of the marked actions, per row, across all tiles; a
+        # run still open at the end of a tile continues into the next one
+        starts, stops = [], []
+        previous = np.zeros((len(best), 1), dtype=bool)
+        for cols in col_tiles:
+            X, Y = kernels.open_grid(own_points[cols], other_points[rows])
+            marked = payoff(X, Y) >= threshold
+            change = np.diff(np.hstack([previous, marked]).view(np.int8), axis=1)
+            starts.append(np.nonzero(change == 1))
+            stops.append(np.nonzero(change == -1))
+            starts[-1][1][:] += cols.start
+            stops[-1][1][:] += cols.start
+            previous = marked[:, -1:]
+        open_rows = np.nonzero(previous[:, 0])[0]
+        stops.append((open_rows, np.full(len(open_rows), num_cols)))
+
+        # Starts and stops pair up once both are sorted by row then column
+        start_row, start_col = (np.concatenate(a) for a in zip(*starts))
+        stop_row, stop_col = (np.concatenate(a) for a in zip(*stops))
+        start_order = np.lexsort((start_col, start_row))
+        stop_order = np.lexsort((stop_col, stop_row))
+        runs.append((start_row[start_order] + rows.start, start_col[start_order], stop_col[stop_order]))
+
+    row, start, stop = (np.concatenate(a).astype(np.int64) for a in zip(*runs))
+    return Responses(row, start, stop, num_rows, num_cols)
+
+def contains(responses, rows, cols):
+    # Whether own action cols is a best response to opponent action rows,
+    # elementwise, by looking up the last run starting at or before it
+    keys = responses.row * responses.num_cols + responses.start
+    index = np.searchsorted(keys, np.asarray(rows) * responses.num_cols + cols, side='right') - 1
+    valid = index >= 0
+    index = np.maximum(index, 0)
+    return valid & (responses.row[index] == rows) & (cols < responses.stop[index])
+
+def pure_equilibria(responses_1, responses_2=None, batch_size=2 ** 22):
+    # Index pairs (i, j) where Player 1's action i is a best response to j and
+    # Player 2's action j is a best response to i. responses_2 has Player 1's
+    # actions as rows; a symmetric game passes only responses_1.
+    responses_2 = responses_1 if responses_2 is None else responses_2
+    lengths = responses_1.stop - responses_1.start
+    ends = np.cumsum(lengths)
+    found_1, found_2 = [], []
+    # Expand the runs into candidate pairs batch_size at a time
+    for first in range(0, int(ends[-1]) if len(ends) else 0, batch_size):
+        k = np.arange(first, min(first + batch_size, int(ends[-1])))
+        run = np.searchsorted(ends, k, side='right')
+        j = responses_1.row[run]
+        i = responses_1.start[run] + k - (ends[run] - lengths[run])
+        keep = contains(responses_2, i, j)
+        found_1.append(i[keep])
+        found_2.append(j[keep])
+    if not found_1:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(found_1), np.concatenate(found_2)
+
+def best_response_segments(responses, own_points, other_points, payoff):
+    # Player 1's best responses as Segments for the renderer: the lowest best
+    # response to every opponent action, plus the highest where the set has
+    # more than one action
+    first = np.r_[True, responses.row[1:] != responses.row[:-1]]
+    last = np.r_[responses.row[1:] != responses.row[:-1], True]
+    segments = []
+    for index in (responses.start[first], responses.stop[last] - 1):
+        x, y = own_points[index], other_points[responses.row[first]]
+        segments.append(Segment(x, y, payoff(x, y), True))
+    if np.array_equal(segments[0].x, segments[1].x):
+        segments.pop()
+    return segments
+
+def solve(payoff, points, tol=1e-9, block_cells=BLOCK_CELLS):
+    # Best responses and pure equilibria of a symmetric game on the square
+    # grid of points. Equilibria are rows of (x1, x2, payoff_1, payoff_2).
+    points = np.asarray(points, dtype=float)
+    responses = best_response_sets(payoff, points, points, tol, block_cells)
+    best_response_1 = best_response_segments(responses, points, points, payoff)
+    best_response_2 = [Segment(s.y, s.x, s.z, s.attained) for s in best_response_1]
+    i, j = pure_equilibria(responses)
+    x1, x2 = points[i], points[j]
+    equilibria = np.column_stack([x1, x2, payoff(x1, x2), payoff(x2, x1)])
+    return Solution(points, responses, best_response_1, best_response_2, equilibria)
+
+def game_solution(game, a, c, num_points, tol=1e-9, block_cells=BLOCK_CELLS):
+    # A game on its usual plotting grid (see registry.game_definition)
+    payoff, x_max = registry.game_definition(game, a, c)[:2]
+    return solve(payoff, np.linspace(0, x_max, num_points), tol, block_cells)
+
+def discrete_frame(frame_data, payoff, points, tol=1e-9, block_cells=BLOCK_CELLS):
+    # A game module's frame with its best responses and equilibrium replaced
+    # by those on the grid. The drawn equilibrium is the grid equilibrium
+    # nearest the continuous one (NaN if the grid has none).
+    a, c, payoff_values_1, payoff_values_2, best_response_1, best_response_2, nash = frame_data
+    solution = solve(lambda own, other: payoff(own, other, c, a), points, tol, block_cells)
+    if len(solution.equilibria):
+        distance = np.hypot(*(solution.equilibria[:, :2] - nash[:2]).T)
+        nash = tuple(solution.equilibria[distance.argmin()].tolist())
+    else:
+        nash = (np.nan,) * 4
+    return a, c, payoff_values_1, payoff_values_2, solution.best_response_1, solution.best_response_2, nash
@@ -0,0 +1,180 @@
+from multiprocessing import Pool
+
+import numpy as np
+from src import kernels, registry
+
+# Expected payoff surfaces when the demand intercept a and the marginal cost c
+# are random.
+#
+# Samples of (a, c) are evaluated a batch at a time as one (samples x grid x
+# grid) kernel call, and folded into streaming estimators: the mean and
+# variance of every grid cell with Welford/Chan updates, and a fixed-bin
+# histogram per cell for quantiles. Player 1's best response in each sample
+# is accumulated the same way. Nothing kept grows with the number of samples.
+#
+# Samples are split into jobs of a fixed size with their own child seeds of
+# one SeedSequence, and job results are merged in job order, so a run is
+# reproducible for a given seed whatever the number of workers. Both players
+# face the same (a, c), so Player 2's surfaces are the transposes.
+
+BLOCK_CELLS = 2 ** 22
+DISTRIBUTIONS = {'normal': 2, 'uniform': 2, 'triangular': 3, 'lognormal': 2}
+
+def parse_distribution(spec):
+    # 'normal:mean:std', 'uniform:low:high', 'triangular:left:mode:right',
+    # 'lognormal:mean:sigma' (of the underlying normal) or a constant
+    name, *args = spec.split(':')
+    if not args:
+        return 'constant', (float(name),)
+    if DISTRIBUTIONS.get(name) != len(args):
+        raise ValueError(f'Unknown distribution {spec!r}, use ' + ', '.join(f'{n}:' + ':'.join('x' * k) for n, k in DISTRIBUTIONS.items()))
+    return name, tuple(float(v) for v in args)
+
+def distribution_mean(distribution):
+    name, args = distribution
+    if name == 'lognormal':
+        return float(np.exp(args[0] + args[1] ** 2 / 2))
+    if name == 'triangular':
+        return sum(args) / 3
+    if name == 'uniform':
+        return (args[0] + args[1]) / 2
+    return args[0]
+
+def draw(rng, distribution, size):
+    name, args = distribution
+    if name == 'constant':
+        return np.full(size, args[0])
+    return getattr(rng, name)(*args, size=size)
+
+class RunningStats:
+    # Count, mean and sum of squared deviations of arrays along the sample
+    # axis. Batches and other accumulators are folded in with Chan et al.'s
+    # pairwise update, which is Welford's for a batch of one.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, batch):
+        other = RunningStats()
+        other.count = len(batch)
+        other.mean = batch.mean(axis=0)
+        other.m2 = ((batch - other.mean) ** 2).sum(axis=0)
+        self.merge(other)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / count)
+        self.count = count
+
+    def variance(self, ddof=1):
+        return self.m2 / max(self.count - ddof, 1)
+
+class HistogramSketch:
+    # Per-cell histograms over fixed bins from low to low + bins * width, with
+    # the exact per-cell minimum and maximum. Values outside the bins count
+    # towards the end bins; quantiles are interpolated within a bin and kept
+    # inside [minimum, maximum], so they are accurate to about one bin width.
+    def __init__(self, low, width, bins):
+        self.low, self.width, self.bins = low, width, bins
+        self.counts = np.zeros(low.shape + (bins,), dtype=np.int64)
+        self.minimum = np.full(low.shape, np.inf)
+        self.maximum = np.full(low.shape, -np.inf)
+
+    @classmethod
+    def from_pilot(cls, pilot, bins=64, margin=0.1):
+        # Bins spanning each cell's range in a pilot batch, widened by margin.
+        # A cell constant in the pilot gets a first bin of almost no width, so
+        # its point mass is not spread over a bin.
+        low, high = pilot.min(axis=0), pilot.max(axis=0)
+        pad = (high - low) * margin
+        span = high - low + 2 * pad
+        return cls(low - pad, np.where(span > 0, span / bins, 1e-9 * np.maximum(np.abs(low), 1)), bins)
+
+    def update(self, batch):
+        index = np.clip(((batch - self.low) / self.width).astype(np.int64), 0, self.bins - 1)
+        cells = np.arange(self.low.size).reshape(self.low.shape) * self.bins
+        flat = (index + cells).ravel()
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        self.minimum = np.minimum(self.minimum, batch.min(axis=0))
+        self.maximum = np.maximum(self.maximum, batch.max(axis=0))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+
+    def quantile(self, q):
+        cumulative = self.counts.cumsum(axis=-1)
+        target = q * cumulative[..., -1]
+        k = np.minimum((cumulative < target[..., None]).sum(axis=-1), self.bins - 1)
+        before = np.take_along_axis(cumulative, k[..., None], -1)[..., 0] - np.take_along_axis(self.counts, k[..., None], -1)[..., 0]
+        in_bin = np.take_along_axis(self.counts, k[..., None], -1)[..., 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.5)
+        return np.clip(self.low + self.width * (k + fraction), self.minimum, self.maximum)
+
+def batch_size(num_points, block_cells=BLOCK_CELLS):
+    return max(block_cells // (num_points * num_points), 1)
+
+def sample_surfaces(game, points, a_values, c_values):
+    # Player 1's payoff for every sample on the grid, shape (samples, n, n)
+    X, Y = kernels.open_grid(points)
+    return registry.load(game).plot_payoff(X, Y, *kernels.expand_params(c_values, a_values))
+
+def run_job(job):
+    game, a_distribution, c_distribution, points, num_samples, seed, bins, block_cells = job
+    rng = np.random.default_rng(seed)
+    payoff, best_response, sketch = RunningStats(), RunningStats(), HistogramSketch(*bins)
+    for start in range(0, num_samples, batch_size(len(points), block_cells)):
+        size = min(batch_size(len(points), block_cells), num_samples - start)
+        values = sample_surfaces(game, points, draw(rng, a_distribution, size), draw(rng, c_distribution, size))
+        payoff.update(values)
+        sketch.update(values)
+        # Rows are Player 2's action, columns Player 1's
+        best_response.update(points[values.argmax(axis=2)])
+    return payoff, best_response, sketch
+
+def expected_surfaces(game, a_spec, c_spec, num_samples=10000, num_points=100, quantiles=(0.05, 0.5, 0.95),
+                      workers=None, seed=0, samples_per_job=2000, bins=64, block_cells=BLOCK_CELLS):
+    # Mean, variance and quantiles of Player 1's payoff on the game's grid for
+    # the mean a and c, and the mean and standard deviation of Player 1's best
+    # response to every action of Player 2, over num_samples draws of (a, c)
+    if game not in ('cournot', 'bertrand'):
+        raise ValueError('Monte Carlo payoffs are available for cournot and bertrand')
+    a_distribution, c_distribution = parse_distribution(a_spec), parse_distribution(c_spec)
+    points = registry.load(game).grid(distribution_mean(a_distribution), distribution_mean(c_distribution), num_points)
+
+    num_jobs = -(-num_samples // samples_per_job)
+    pilot_seed, *seeds = np.random.SeedSequence(seed).spawn(num_jobs + 1)
+    # Histogram bins from a pilot batch, shared by every job so they merge
+    rng = np.random.default_rng(pilot_seed)
+    size = min(batch_size(num_points, block_cells), 256)
+    sketch = HistogramSketch.from_pilot(sample_surfaces(game, points, draw(rng, a_distribution, size), draw(rng, c_distribution, size)), bins)
+
+    layout = (sketch.low, sketch.width, sketch.bins)
+    jobs = [(game, a_distribution, c_distribution, points, min(samples_per_job, num_samples - i * samples_per_job), s, layout, block_cells)
+            for i, s in enumerate(seeds)]
+    payoff, best_response = RunningStats(), RunningStats()
+    with Pool(workers) as pool:
+        for job_payoff, job_best_response, job_sketch in pool.imap(run_job, jobs):
+            payoff.merge(job_payoff)
+            best_response.merge(job_best_response)
+            sketch.merge(job_sketch)
+
+    return {
+        'points': points,
+        'samples': payoff.count,
+        'mean': payoff.mean,
+        'variance': payoff.variance(),
+        'quantile_levels': np.array(quantiles),
+        'quantiles': np.array([sketch.quantile(q) for q in quantiles]),
+        'best_response_mean': best_response.mean,
+        'best_response_std': np.sqrt(best_response.variance()),
+        # The risk-neutral best response: maximizing expected payoff
+        'expected_best_response': points[payoff.mean.argmax(axis=1)],
+    }
@@ -0,0 +1,250 @@
+from collections import namedtuple
+
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.tri import Triangulation
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from src import profiling
+
+# Drawing helpers shared by the game visualizations
+
+# Caps on what is handed to matplotlib per axes, whatever the resolution the
+# payoffs were computed at: rows/columns of surface quads, grid points per
+# axis fed to contour, contour levels and best response markers. None means
+# no cap. Equilibria and statistics are computed from the full data before
+# any of this applies.
+RenderBudget = namedtuple('RenderBudget', ['surface_cells', 'contour_points', 'contour_levels', 'markers'])
+
+BUDGETS = {
+    'low': RenderBudget(25, 100, 10, 500),
+    'medium': RenderBudget(50, 200, 25, 2000),
+    'high': RenderBudget(100, 400, 50, 10000),
+    'full': RenderBudget(None, None, None, None),
+}
+
+def sample_limit(budget, num_points):
+    # Adaptive samples worth computing for a budget: no more than the uniform
+    # grid, nor than the grid points of the surface the budget would draw
+    limit = num_points * num_points
+    if budget.surface_cells is not None:
+        limit = min(limit, (budget.surface_cells + 1) ** 2)
+    return limit
+
+def segment_points(segments):
+    # Concatenate polyline segments into flat x, y, z arrays
+    if not segments:
+        return np.empty(0), np.empty(0), np.empty(0)
+    return tuple(np.concatenate([getattr(s, k) for s in segments]) for k in 'xyz')
+
+def surface_indices(n, count=50):
+    # Same row/column subsampling plot_surface uses by default (rcount=ccount=50)
+    if count is None:
+        return np.arange(n)
+    stride = max(int(np.ceil(n / count)), 1)
+    return np.r_[0:n - 1:stride, n - 1]
+
+def decimate_points(x, y, z, max_points=None):
+    # Drop points matplotlib would not draw anyway (NaN or infinite) and keep
+    # at most max_points of the rest, evenly spread along the arrays
+    finite = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+    x, y, z = x[finite], y[finite], z[finite]
+    if max_points is not None and len(x) > max_points:
+        keep = np.linspace(0, len(x) - 1, max_points).round().astype(int)
+        x, y, z = x[keep], y[keep], z[keep]
+    return x, y, z
+
+def surface_polygons(x_points, y_points, Z, rows, cols):
+    # Quads of the surface over the (x, y) grid as an (n_quads, 4, 3) array
+    # plus the mean height of each quad, which plot_surface uses for colour
+    x, y, z = x_points[cols], y_points[rows], Z[np.ix_(rows, cols)]
+    X, Y = np.meshgrid(x, y)
+    corners = [(slice(None, -1), slice(None, -1)), (slice(None, -1), slice(1, None)),
+               (slice(1, None), slice(1, None)), (slice(1, None), slice(None, -1))]
+    verts = np.stack([np.stack([A[k].ravel() for k in corners], axis=-1) for A in (X, Y, z)], axis=-1)
+    return verts, verts[:, :, 2].mean(axis=1)
+
+def contour_artists(contour_set):
+    # ContourSet is a single artist from matplotlib 3.8, a list of collections before
+    return [contour_set] if isinstance(contour_set, Artist) else list(contour_set.collections)
+
+def supports_blit(fig):
+    # 3D collections are only projected inside Axes3D.draw, so draw_artist
+    # cannot redraw them on their own (the surfaces vanish and contours come
+    # out unprojected), and the colorbars would not follow the frames either.
+    # Figures with 3D axes are always redrawn in full.
+    if any(ax.name == '3d' for ax in fig.axes):
+        return False
+    return getattr(fig.canvas, 'supports_blit', False)
+
+class GameRenderer:
+    # Two 3D payoff surfaces with best response curves over a 2D best response
+    # panel. Artists are created once by the first draw() and later frames
+    # only replace their data, so an animation never rebuilds its axes.
+    # Limits are fixed by the first frame. The figure has 3D axes, so
+    # animations redraw it in full rather than blitting (see supports_blit).
+
+    def __init__(self, fig, x_points, y_points, labels, surface_cmaps=('viridis', 'plasma'),
+                 best_response_cmaps=('Reds', 'Blues'), alpha=0.5, dot_size=10, contour_levels=None, zlim_from_zero=False,
+                 budget=BUDGETS['medium']):
+        self.fig = fig
+        self.labels = labels
+        self.surface_cmaps = surface_cmaps
+        self.best_response_cmaps = best_response_cmaps
+        self.alpha = alpha
+        self.dot_size = dot_size
+        self.contour_levels = contour_levels
+        self.zlim_from_zero = zlim_from_zero
+        self.budget = budget
+        self.set_grid(x_points, y_points)
+
+        self.ax3d_1 = fig.add_subplot(221, projection='3d')
+        self.ax3d_2 = fig.add_subplot(222, projection='3d')
+        self.ax_scatter = fig.add_subplot(212)
+        self.surfaces = []
+        self.lines = [[], []]
+        self.contours = [None, None, None]
+        self.drawn = False
+
+    def set_grid(self, x_points, y_points):
+        # Later frames are drawn over a different grid, with limits taken
+        # from the next frame (used by the interactive mode)
+        self.x_points = np.asarray(x_points)
+        self.y_points = np.asarray(y_points)
+        self.rows = surface_indices(len(self.y_points), self.budget.surface_cells)
+        self.cols = surface_indices(len(self.x_points), self.budget.surface_cells)
+        self.contour_rows = surface_indices(len(self.y_points), self.budget.contour_points)
+        self.contour_cols = surface_indices(len(self.x_points), self.budget.contour_points)
+        self.rescale = True
+
+    @property
+    def blit(self):
+        return supports_blit(self.fig)
+
+    def artists(self):
+        contours = [a for cs in self.contours if cs is not None for a in contour_artists(cs)]
+        return self.surfaces + self.lines[0] + self.lines[1] + self.markers + self.texts + contours
+
+    def draw(self, a, c, payoff_values_1, payoff_values_2, best_response_1, best_response_2, nash):
+        if not self.drawn:
+            self._create(payoff_values_1, payoff_values_2, best_response_1, best_response_2)
+            self.drawn = True
+        if self.rescale:
+            self._set_limits(payoff_values_1, payoff_values_2)
+            self.rescale = False
+
+        axes_3d = (self.ax3d_1, self.ax3d_2)
+        with profiling.stage('surfaces'):
+            for i, payoff_values in enumerate((payoff_values_1, payoff_values_2)):
+                verts, heights = self.polygons(payoff_values)
+                self.surfaces[i].set_verts(verts)
+                self.surfaces[i].set_array(heights)
+                self.surfaces[i].autoscale()
+        with profiling.stage('best_response_lines'):
+            for i, (segments, color) in enumerate(((best_response_1, 'red'), (best_response_2, 'blue'))):
+                self._update_lines(axes_3d[i], self.lines[i], segments, color, f'Best Response Player {i + 1}')
+                x, y, z = decimate_points(*segment_points(segments), self.budget.markers)
+                self.markers[i].set_offsets(np.column_stack([x, y]))
+                self.markers[i].set_array(z)
+                self.markers[i].autoscale()
+            self.markers[2].set_offsets([nash[:2]])
+
+        if self.contour_levels is not None:
+            with profiling.stage('contours'):
+                self._update_contours(payoff_values_1, payoff_values_2)
+
+        for text in self.texts:
+            text.set_text(f'c={c}' if a is None else f'a={a}, c={c}')
+        return self.artists()
+
+    def _create(self, payoff_values_1, payoff_values_2, best_response_1, best_response_2):
+        x_label, y_label = self.labels
+        for i, (ax, payoff_values) in enumerate(((self.ax3d_1, payoff_values_1), (self.ax3d_2, payoff_values_2))):
+            verts, heights = self.polygons(payoff_values)
+            surface = Poly3DCollection(verts, cmap=self.surface_cmaps[i], edgecolor='k', alpha=self.alpha, label=f'Payoff Player {i + 1}')
+            surface.set_array(heights)
+            ax.add_collection3d(surface)
+            self.surfaces.append(surface)
+            ax.set_xlabel(x_label)
+            ax.set_ylabel(y_label)
+            ax.set_zlabel('Payoff')
+            ax.set_title(f'Payoff and Best Response Player {i + 1}')
+
+        self.markers = []
+        for i, segments in enumerate((best_response_1, best_response_2)):
+            x, y, z = decimate_points(*segment_points(segments), self.budget.markers)
+            self.markers.append(self.ax_scatter.scatter(x, y, c=z, s=self.dot_size, cmap=self.best_response_cmaps[i], label=f'Best Response Player {i + 1}'))
+        self.markers.append(self.ax_scatter.scatter([np.nan], [np.nan], color='black', marker='*', s=self.dot_size * 20, label='Nash Equilibrium', zorder=3))
+        self.ax_scatter.set_xlabel(x_label)
+        self.ax_scatter.set_ylabel(y_label)
+        self.ax_scatter.set_title('Best Response Values Scatter Plot')
+        # Add a colorbar for the scatter plot
+        self.fig.colorbar(self.markers[0], ax=self.ax_scatter, label='Payoff')
+        self.fig.colorbar(self.markers[1], ax=self.ax_scatter, label='Payoff')
+
+        # Parameters are shown inside the axes rather than in the titles
+        self.texts = [ax.text2D(0.02, 0.98, '', transform=ax.transAxes, va='top') for ax in (self.ax3d_1, self.ax3d_2)]
+        self.texts.append(self.ax_scatter.text(0.01, 0.97, '', transform=self.ax_scatter.transAxes, va='top'))
+
+    def _set_limits(self, payoff_values_1, payoff_values_2):
+        for ax, payoff_values in ((self.ax3d_1, payoff_values_1), (self.ax3d_2, payoff_values_2)):
+            ax.set_xlim(self.x_points.min(), self.x_points.max())
+            ax.set_ylim(self.y_points.min(), self.y_points.max())
+            z_min = 0 if self.zlim_from_zero else np.nanmin(self.heights(payoff_values))
+            ax.set_zlim(z_min, np.nanmax(self.heights(payoff_values)))
+        self.ax_scatter.set_xlim(0, self.x_points.max())
+        self.ax_scatter.set_ylim(0, self.y_points.max())
+
+    def heights(self, payoff_values):
+        return payoff_values
+
+    def polygons(self, payoff_values):
+        return surface_polygons(self.x_points, self.y_points, payoff_values, self.rows, self.cols)
+
+    def contour(self, ax, payoff_values, **kwargs):
+        rows, cols = self.contour_rows, self.contour_cols
+        return ax.contour(self.x_points[cols], self.y_points[rows], payoff_values[np.ix_(rows, cols)], **kwargs)
+
+    def _update_lines(self, ax, lines, segments, color, label):
+        # Attained best responses are drawn solid, suprema (Bertrand undercutting) dashed
+        while len(lines) < len(segments):
+            lines += ax.plot([], [], [], color=color, linewidth=2, label=label if not lines else None)
+        for line, s in zip(lines, segments):
+            line.set_data_3d(s.x, s.y, s.z)
+            line.set_linestyle('-' if s.attained else '--')
+        for line in lines[len(segments):]:
+            line.set_data_3d([], [], [])
+
+    def _update_contours(self, payoff_values_1, payoff_values_2):
+        # Contour sets cannot be edited in place, so they are swapped
+        for cs in self.contours:
+            if cs is not None:
+                for artist in contour_artists(cs):
+                    artist.remove()
+        targets = ((self.ax3d_1, payoff_values_1), (self.ax3d_2, payoff_values_2), (self.ax_scatter, payoff_values_1))
+        for i, ((ax, payoff_values), num_levels) in enumerate(zip(targets, self.contour_levels)):
+            low, high = np.nanmin(self.heights(payoff_values)), np.nanmax(self.heights(payoff_values))
+            if not high > low:
+                self.contours[i] = None
+                continue
+            if self.budget.contour_levels is not None:
+                num_levels = min(num_levels, self.budget.contour_levels)
+            levels = np.linspace(low, high, num_levels)
+            if ax is self.ax_scatter:
+                self.contours[i] = self.contour(ax, payoff_values, levels=levels, colors='black', alpha=0.5)
+            else:
+                self.contours[i] = self.contour(ax, payoff_values, zdir='z', offset=ax.get_zlim()[0], levels=levels, cmap='viridis', alpha=0.5)
+
+class AdaptiveRenderer(GameRenderer):
+    # Draws adaptively refined samples (src/adaptive.py) instead of regular
+    # grids, as triangulated surfaces and contours
+
+    def heights(self, samples):
+        return samples.z
+
+    def polygons(self, samples):
+        triangles = Triangulation(samples.x, samples.y).triangles
+        verts = np.column_stack([samples.x, samples.y, samples.z])[triangles]
+        return verts, verts[:, :, 2].mean(axis=1)
+
+    def contour(self, ax, samples, **kwargs):
+        return ax.tricontour(samples.x, samples.y, samples.z, **kwargs)
@@ -0,0 +1,144 @@
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+
+# Per-stage timing of the visualizations.
+#
+# stage(name) wraps one step of the pipeline (payoff surfaces, best
+# responses, surface updates, contours, canvas drawing, ...). While profiling
+# is off it returns one shared no-op context, so an instrumented step costs a
+# function call and an empty with block. While on, every stage records its
+# wall time and the net number of memory blocks it allocated
+# (sys.getallocatedblocks), tagged with the animation frame being produced.
+# The events are written as a per-frame JSON summary and as a Chrome trace
+# (chrome://tracing or https://ui.perfetto.dev).
+
+_NULL = contextlib.nullcontext()
+_profile = None
+
+class Profile:
+    def __init__(self):
+        self.events = []
+        self.frame = None
+        self.pid = os.getpid()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.events.append({'name': name, 'frame': self.frame, 'start': start, 'duration': duration,
+                                'blocks': sys.getallocatedblocks() - blocks, 'pid': self.pid})
+
+def enable():
+    global _profile
+    _profile = Profile()
+
+def disable():
+    global _profile
+    _profile = None
+
+def enabled():
+    return _profile is not None
+
+def stage(name):
+    return _NULL if _profile is None else _profile.stage(name)
+
+def frames(iterable, start=0):
+    # Tag everything that happens while a frame is produced and drawn with its
+    # index. Frames are numbered before they are pulled from the source, so
+    # work the source does for a frame counts towards it.
+    if _profile is None:
+        return iterable
+    return _numbered(iterable, start)
+
+def _numbered(iterable, start):
+    iterator = iter(iterable)
+    for i in itertools.count(start):
+        _profile.frame = i
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        yield item
+
+def instrument_figure(fig):
+    # Time full canvas draws and the per-artist draws used when blitting
+    if _profile is None:
+        return
+    draw = fig.draw
+    def profiled_draw(renderer):
+        with stage('canvas_draw'):
+            return draw(renderer)
+    fig.draw = profiled_draw
+
+    for ax in fig.axes:
+        draw_artist = ax.draw_artist
+        def profiled_draw_artist(artist, draw_artist=draw_artist):
+            with stage('draw_artist'):
+                return draw_artist(artist)
+        ax.draw_artist = profiled_draw_artist
+
+def take_events():
+    # Events recorded so far in this process, e.g. to send them back from a
+    # worker; the profile keeps recording afterwards
+    if _profile is None:
+        return []
+    events, _profile.events = _profile.events, []
+    return events
+
+def add_events(events):
+    if _profile is not None:
+        _profile.events.extend(events)
+
+def summary(events):
+    # Time, calls and allocated blocks of every stage, per frame and in total.
+    # Work done outside any frame (figure creation) is listed under 'setup'.
+    def add(table, event):
+        entry = table.setdefault(event['name'], {'calls': 0, 'ms': 0.0, 'blocks': 0})
+        entry['calls'] += 1
+        entry['ms'] += event['duration'] * 1000
+        entry['blocks'] += event['blocks']
+
+    setup, per_frame, totals = {}, {}, {}
+    for event in events:
+        add(setup if event['frame'] is None else per_frame.setdefault(event['frame'], {}), event)
+        add(totals, event)
+    return {
+        'setup': setup,
+        'frames': [{'frame': frame, 'stages': per_frame[frame]} for frame in sorted(per_frame)],
+        'totals': totals,
+    }
+
+def chrome_trace(events):
+    # Complete ('X') events in microseconds since the first recorded stage
+    origin = min((event['start'] for event in events), default=0)
+    return {
+        'displayTimeUnit': 'ms',
+        'traceEvents': [{
+            'name': event['name'],
+            'cat': 'setup' if event['frame'] is None else 'frame',
+            'ph': 'X',
+            'ts': (event['start'] - origin) * 1e6,
+            'dur': event['duration'] * 1e6,
+            'pid': event['pid'],
+            'tid': event['pid'],
+            'args': {'frame': event['frame'], 'blocks': event['blocks']},
+        } for event in events],
+    }
+
+def write(path):
+    # <path> gets the summary, <root>.trace.json the Chrome trace
+    events = take_events()
+    with open(path, 'w') as f:
+        json.dump(summary(events), f, indent=2)
+    trace_path = os.path.splitext(path)[0] + '.trace.json'
+    with open(trace_path, 'w') as f:
+        json.dump(chrome_trace(events), f)
+    print(f'Wrote profile of {len(events)} stage(s) to {path} and {trace_path}')
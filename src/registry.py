@@ -0,0 +1,85 @@
+import importlib
+
+# The games by name. Modules are imported on first use, and importing a game
+# does not import matplotlib: game modules import it only inside the
+# functions that draw, so their payoffs, frames and compute() work without
+# it. compute() gives a game's arrays and equilibria for scripts and batch
+# jobs, and game_definition() the payoff and equilibrium that the sweeps,
+# tiled surfaces, bimatrix solver and benchmarks work from.
+#
+# Every game module has
+#   compute(*params, **options)         arrays and equilibria, no matplotlib
+#   create_figure(*params, **options)   (fig, draw, frame_source, num_frames)
+#   frame_count(*params)
+# where params are the game's PARAMS below.
+
+GAMES = {
+    'cournot': 'src.cournot',
+    'bertrand': 'src.bertrand',
+    'brf': 'src.relationship_brf',
+    'folk': 'src.folk_theorum',
+}
+
+PARAMS = {
+    'cournot': ('a', 'c'),
+    'bertrand': ('a', 'c'),
+    'brf': ('c',),
+    'folk': (),
+}
+
+def load(game):
+    if game not in GAMES:
+        raise ValueError(f'Unknown game {game!r}, use one of {", ".join(GAMES)}')
+    return importlib.import_module(GAMES[game])
+
+def game_params(game, values):
+    # The game's positional parameters from a mapping such as vars(args)
+    return tuple(values[name] for name in PARAMS[game])
+
+def compute(game, *params, **options):
+    # cournot, bertrand and brf return (grid points, (a, c, payoff_1,
+    # payoff_2, best_response_1, best_response_2, nash)), folk returns
+    # (deltas, x_values, y_values)
+    return load(game).compute(*params, **options)
+
+def game_definition(game, a, c):
+    # The game's payoff, the upper end of its plotted grid, its Nash
+    # equilibrium and the market price and quantity at that equilibrium
+    import numpy as np
+    from src import solvers
+
+    if game == 'cournot':
+        plot_payoff = load(game).plot_payoff
+        x1, x2, payoff_1, payoff_2 = solvers.cournot_nash(a, c)
+        payoff = lambda own, other: plot_payoff(own, other, c, a)
+        return payoff, a - c, (x1, x2, payoff_1, payoff_2), a - (x1 + x2), x1 + x2
+    if game == 'bertrand':
+        plot_payoff = load(game).plot_payoff
+        x1, x2, payoff_1, payoff_2 = solvers.bertrand_nash(a, c)
+        payoff = lambda own, other: plot_payoff(own, other, c, a)
+        return payoff, 2 * (a + c), (x1, x2, payoff_1, payoff_2), x1, a - x1
+    if game == 'brf':
+        plot_payoff = load(game).plot_payoff
+        payoff = lambda own, other: plot_payoff(own, other, c)
+        return payoff, 4 * c, solvers.brf_nash(c), np.nan, np.nan
+    raise ValueError(f'Unknown game {game!r}')
+
+def result_arrays(game, result):
+    # A compute() result as flat named arrays, e.g. for np.savez. Adaptive
+    # samples and best response segments are split into _x, _y, _z arrays.
+    import numpy as np
+
+    if game == 'folk':
+        deltas, x_values, y_values = result
+        return {'deltas': deltas, 'x_values': x_values, 'y_values': y_values}
+
+    points, (a, c, payoff_1, payoff_2, best_response_1, best_response_2, nash) = result
+    arrays = {'points': points, 'nash': np.array(nash)}
+    for name, payoff in (('payoff_1', payoff_1), ('payoff_2', payoff_2)):
+        if isinstance(payoff, tuple):
+            arrays.update({f'{name}_{axis}': values for axis, values in zip('xyz', payoff)})
+        else:
+            arrays[name] = payoff
+    for name, segments in (('best_response_1', best_response_1), ('best_response_2', best_response_2)):
+        arrays.update({f'{name}_{axis}': np.concatenate([getattr(s, axis) for s in segments]) for axis in 'xyz'})
+    return arrays
@@ -1,67 +1,70 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+from src import adaptive, kernels, profiling, solvers
 
 def plot_payoff(a1, a2, c):
-    return a1 * (c + a2 - a1)
-
-def plot_best_response(a1, a2, c):
-    best_response = 1/2 * (c + a2)
-    tolerance = 1
-
-    if abs(a1 - best_response) < tolerance:
-        return plot_payoff(a1, a2, c)
-    else:
-        return np.nan
-
-def brf_game(c):
-    # Generate points for the payoff surface
-    a1_values = np.linspace(0, 4*c, 100)
-    a2_values = np.linspace(0, 4*c, 100)
-    A1, A2 = np.meshgrid(a1_values, a2_values)
-
-    # Player 1
-    payoff_values_1 = np.vectorize(plot_payoff)(A1, A2, c)
-    best_response_values_1 = np.vectorize(plot_best_response)(A1, A2, c)
-    # Player 2
-    payoff_values_2 = np.vectorize(plot_payoff)(A2, A1, c)
-    best_response_values_2 = np.vectorize(plot_best_response)(A2, A1, c)
+    return kernels.brf_payoff(a1, a2, c)
 
-    # Create a 3D plot
-    fig = plt.figure(figsize=(12, 10))
+def plot_best_response(c, a_max, num_points):
+    # Player 1's best response line, Player 2's is the same with the axes swapped
+    best_response_1 = solvers.brf_best_response(c, a_max, num_points)
+    return best_response_1, solvers.swap_players(best_response_1)
+
+def adaptive_surfaces(c, a_max, num_points, max_samples=None):
+    # Adaptively refined payoff samples, dense along Player 1's best response,
+    # no finer than a grid of num_points and at most max_samples of them
+    samples_1 = adaptive.refine(lambda a1, a2: plot_payoff(a1, a2, c), a_max, a_max, *adaptive.levels(num_points),
+                                max_samples=max_samples or num_points ** 2,
+                                features=[lambda a1, a2: a1 - 1/2 * (c + a2)])
+    return samples_1, adaptive.swap_players(samples_1)
+
+def frame_count(c):
+    return 1
+
+def grid(c, num_points):
+    return np.linspace(0, 4*c, num_points)
+
+def compute(c, num_points=100, adaptive=False, max_samples=None):
+    # The grid and the data of the single frame, as drawn by create_figure
+    a_values = grid(c, num_points)
+
+    # Player 2's surfaces are the transposes of Player 1's
+    with profiling.stage('payoff_surfaces'):
+        if adaptive:
+            payoff_values_1, payoff_values_2 = adaptive_surfaces(c, a_values[-1], num_points, max_samples)
+        else:
+            payoff_values_1, payoff_values_2 = kernels.symmetric_surfaces(plot_payoff, a_values, c)
+    with profiling.stage('best_response'):
+        best_response_1, best_response_2 = plot_best_response(c, a_values[-1], len(a_values))
+    return a_values, (None, c, payoff_values_1, payoff_values_2, best_response_1, best_response_2, solvers.brf_nash(c))
+
+def make_renderer(fig, a_values, adaptive=False, detail='medium'):
+    from src.plotting import BUDGETS, AdaptiveRenderer, GameRenderer
 
-    # Plot payoff values and best response values for Player 1
-    ax3d_1 = fig.add_subplot(221, projection='3d')
-    surf1 = ax3d_1.plot_surface(A1, A2, payoff_values_1, cmap='viridis', edgecolor='k', alpha=0.5, label='Payoff Player 1')
-    sc1 = ax3d_1.scatter(A1, A2, best_response_values_1, color='red', s=50, label='Best Response Player 1', depthshade=False)
-    ax3d_1.set_xlabel('A1')
-    ax3d_1.set_ylabel('A2')
-    ax3d_1.set_zlabel('Payoff')
-    ax3d_1.set_title('Payoff and Best Response Player 1')
-
-    # Plot payoff values and best response values for Player 2
-    ax3d_2 = fig.add_subplot(222, projection='3d')
-    surf2 = ax3d_2.plot_surface(A1, A2, payoff_values_2, cmap='plasma', edgecolor='k', alpha=0.5, label='Payoff Player 2')
-    sc2 = ax3d_2.scatter(A1, A2, best_response_values_2, color='blue', s=50, label='Best Response Player 2', depthshade=False)
-    ax3d_2.set_xlabel('A1')
-    ax3d_2.set_ylabel('A2')
-    ax3d_2.set_zlabel('Payoff')
-    ax3d_2.set_title('Payoff and Best Response Player 2')
-
-    # Plot best response values for Player 1 and Player 2
-    ax_scatter = fig.add_subplot(212)
-    sc3 = ax_scatter.scatter(A1.flatten(), A2.flatten(), c=best_response_values_1.flatten(), s=50, cmap='Reds', label='Best Response Player 1')
-    sc4 = ax_scatter.scatter(A1.flatten(), A2.flatten(), c=best_response_values_2.flatten(), s=50, cmap='Blues', label='Best Response Player 2')
-    ax_scatter.set_xlabel('A1')
-    ax_scatter.set_ylabel('A2')
-    ax_scatter.set_title('Best Response Values Scatter Plot')
-    # Add a colorbar for the scatter plot
-    cbar = fig.colorbar(sc3, ax=ax_scatter, label='Payoff')
-    cbar = fig.colorbar(sc4, ax=ax_scatter, label='Payoff')
+    return (AdaptiveRenderer if adaptive else GameRenderer)(fig, a_values, a_values, ('A1', 'A2'), dot_size=50, budget=BUDGETS[detail])
 
+def create_figure(c, adaptive=False, num_points=100, detail='medium'):
+    # Same interface as the animated games' create_figure, with one static frame
+    import matplotlib.pyplot as plt
+    from src.plotting import BUDGETS, sample_limit
+
+    a_values, frame_data = compute(c, num_points, adaptive, sample_limit(BUDGETS[detail], num_points))
+
+    # Create a 3D plot
+    fig = plt.figure(figsize=(12, 10))
+    renderer = make_renderer(fig, a_values, adaptive, detail)
+    renderer.draw(*frame_data)
 
     # Adjust layout
     plt.tight_layout()
 
+    return fig, lambda frame_data: renderer.artists(), range, frame_count(c)
+
+def brf_game(c, adaptive=False, detail='medium'):
+    import matplotlib.pyplot as plt
+
+    with profiling.stage('create_figure'):
+        fig = create_figure(c, adaptive, detail=detail)[0]
+    profiling.instrument_figure(fig)
+
     # Show the plot
-    plt.show()
\ No newline at end of file
+    plt.show()
@@ -0,0 +1,300 @@
+import asyncio
+import io
+import json
+import math
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from urllib.parse import parse_qs, urlsplit
+
+from src import registry
+
+# A long-running local HTTP server for the charts and equilibrium data.
+#
+#   GET /<game>.png|svg|json?a=50&c=1&frame=0&num_points=300&detail=medium&adaptive=1&discrete=1&dpi=100
+#   GET /health
+#
+# Rendering runs in a pool of worker processes that import matplotlib and the
+# game modules once at startup and keep the last few figures they built, so
+# another frame or format of the same chart only redraws. Responses are kept
+# in an LRU cache bounded by size. Identical requests arriving while one is
+# being rendered wait for that render instead of starting their own, and at
+# most max_concurrent renders run at a time; beyond max_queue distinct renders
+# waiting, requests are turned away with 503.
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'json': 'application/json'}
+DETAILS = ('low', 'medium', 'high', 'full')
+MAX_POINTS = 5000
+FIGURES_PER_WORKER = 4
+KEEP_ALIVE = 15
+# Request bodies up to this size are read and discarded so the connection can
+# be kept alive; beyond it, or with chunked bodies, the connection is closed
+MAX_BODY = 2 ** 20
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+def parse_request(target):
+    # (game, format, params, options, frame, dpi) for a chart URL, the key of
+    # the response cache. Raises LookupError for unknown paths and ValueError
+    # for bad parameters.
+    url = urlsplit(target)
+    game, _, fmt = url.path.strip('/').partition('.')
+    if game not in registry.GAMES or fmt not in FORMATS:
+        raise LookupError(url.path)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+    allowed = set(registry.PARAMS[game]) | {'frame', 'num_points', 'dpi'}
+    if game != 'folk':
+        allowed |= {'detail', 'adaptive'}
+    if game in ('cournot', 'bertrand'):
+        allowed.add('discrete')
+    unknown = set(query) - allowed
+    if unknown:
+        raise ValueError(f'Unknown parameter(s) {", ".join(sorted(unknown))} for {game}')
+    missing = [name for name in registry.PARAMS[game] if name not in query]
+    if missing:
+        raise ValueError(f'Missing parameter(s) {", ".join(missing)}')
+
+    params = tuple(float(query[name]) for name in registry.PARAMS[game])
+    if not all(math.isfinite(p) for p in params):
+        raise ValueError('Parameters must be finite')
+    if game in ('cournot', 'bertrand') and params[0] <= params[1]:
+        raise ValueError('a must be greater than c')
+
+    options = {}
+    if 'num_points' in query:
+        options['num_points'] = int(query['num_points'])
+        if not 2 <= options['num_points'] <= MAX_POINTS:
+            raise ValueError(f'num_points must be between 2 and {MAX_POINTS}')
+    for flag in ('adaptive', 'discrete'):
+        if query.get(flag, '').lower() in {'true', '1', 't'}:
+            options[flag] = True
+    # Drawing options do not change the JSON, so they are left out of its key
+    dpi = None
+    if fmt != 'json':
+        if game != 'folk':
+            options['detail'] = query.get('detail', 'medium')
+            if options['detail'] not in DETAILS:
+                raise ValueError(f'detail must be one of {", ".join(DETAILS)}')
+        dpi = float(query.get('dpi', 100))
+        if not 10 <= dpi <= 600:
+            raise ValueError('dpi must be between 10 and 600')
+    return game, fmt, params, tuple(sorted(options.items())), int(query.get('frame', 0)), dpi
+
+def _jsonable(values):
+    # Arrays as nested lists with non-finite values as null
+    if isinstance(values, float):
+        return values if math.isfinite(values) else None
+    if isinstance(values, (list, tuple)):
+        return [_jsonable(v) for v in values]
+    return _jsonable(values.tolist()) if hasattr(values, 'tolist') else values
+
+def equilibrium_data(game, params, options, frame):
+    module = registry.load(game)
+    if game == 'folk':
+        deltas, x_values, y_values = module.compute(**options)
+        return {'game': game, 'frame': frame, 'delta': deltas[frame],
+                'x_values': _jsonable(x_values), 'y_values': _jsonable(y_values[frame])}
+
+    # brf is a single static frame (render() has checked frame == 0)
+    if game != 'brf':
+        options = dict(options, frame=frame)
+    points, (a, c, payoff_1, payoff_2, best_response_1, best_response_2, nash) = module.compute(*params, **options)
+    x1, x2, nash_payoff_1, nash_payoff_2 = nash
+    return {
+        'game': game, 'frame': frame, 'a': _jsonable(a), 'c': _jsonable(c), 'num_points': len(points),
+        'grid': [float(points[0]), float(points[-1])],
+        'nash': {'x1': x1, 'x2': x2, 'payoff_1': nash_payoff_1, 'payoff_2': nash_payoff_2},
+        'best_response_1': [{'x': _jsonable(s.x), 'y': _jsonable(s.y), 'z': _jsonable(s.z), 'attained': s.attained}
+                            for s in best_response_1],
+    }
+
+# Figures a worker has built, by (game, params, options)
+_figures = OrderedDict()
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    for game in registry.GAMES:
+        registry.load(game)
+
+def _warm():
+    return None
+
+def _figure(game, params, options):
+    import matplotlib.pyplot as plt
+
+    key = (game, params, options)
+    if key in _figures:
+        _figures.move_to_end(key)
+        return _figures[key]
+    _figures[key] = registry.load(game).create_figure(*params, **dict(options))
+    if len(_figures) > FIGURES_PER_WORKER:
+        plt.close(_figures.popitem(last=False)[1][0])
+    return _figures[key]
+
+def render(key):
+    # The response body for a parse_request() key, run in a worker
+    game, fmt, params, options, frame, dpi = key
+    num_frames = registry.load(game).frame_count(*params)
+    if not 0 <= frame < max(num_frames, 1):
+        raise ValueError(f'frame must be between 0 and {max(num_frames, 1) - 1}')
+    if fmt == 'json':
+        return json.dumps(equilibrium_data(game, params, dict(options), frame)).encode()
+
+    fig, draw, frame_source, num_frames = _figure(game, params, options)
+    draw(next(iter(frame_source(frame, frame + 1))))
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi)
+    return buffer.getvalue()
+
+class ResponseCache:
+    # Least recently used responses up to max_bytes in total
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        body = self.entries.get(key)
+        if body is not None:
+            self.entries.move_to_end(key)
+        return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self.size -= len(self.entries.popitem(last=False)[1])
+
+class Busy(Exception):
+    pass
+
+class RenderServer:
+    def __init__(self, pool, max_concurrent, cache_bytes=256 * 2 ** 20, max_queue=64):
+        self.pool = pool
+        self.cache = ResponseCache(cache_bytes)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_queue = max_queue
+        self.pending = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'rejected': 0, 'errors': 0}
+
+    async def get(self, key):
+        # The response body and whether it came from the cache, a render in
+        # flight or a new render
+        body = self.cache.get(key)
+        if body is not None:
+            self.stats['hits'] += 1
+            return body, 'hit'
+        if key in self.pending:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.pending[key]), 'coalesced'
+        if len(self.pending) >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise Busy()
+
+        self.stats['misses'] += 1
+        task = asyncio.ensure_future(self._render(key))
+        self.pending[key] = task
+        task.add_done_callback(lambda _: self.pending.pop(key, None))
+        # A client hanging up does not cancel a render others may be waiting on
+        return await asyncio.shield(task), 'miss'
+
+    async def _render(self, key):
+        async with self.semaphore:
+            body = await asyncio.get_running_loop().run_in_executor(self.pool, render, key)
+        self.cache.put(key, body)
+        return body
+
+    async def respond(self, method, target):
+        # (status, content type, body, cache state)
+        if method != 'GET':
+            return 405, 'text/plain', b'Only GET is supported\n', None
+        if urlsplit(target).path == '/health':
+            health = dict(self.stats, cached=len(self.cache.entries), cache_bytes=self.cache.size, in_flight=len(self.pending))
+            return 200, FORMATS['json'], json.dumps(health).encode(), None
+        try:
+            key = parse_request(target)
+            body, state = await self.get(key)
+        except LookupError:
+            return 404, 'text/plain', b'Use /<game>.png, .svg or .json with the game parameters\n', None
+        except ValueError as error:
+            return 400, 'text/plain', f'{error}\n'.encode(), None
+        except Busy:
+            return 503, 'text/plain', b'Too many renders queued, retry later\n', None
+        except Exception as error:
+            self.stats['errors'] += 1
+            return 500, 'text/plain', f'{type(error).__name__}: {error}\n'.encode(), None
+        return 200, FORMATS[key[1]], body, state
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 with keep-alive; request bodies are not used, but must be
+        # skipped so they are not read as the next request
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE)
+                except asyncio.TimeoutError:
+                    break
+                if not line.strip():
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                framed = 'transfer-encoding' not in headers and 0 <= length <= MAX_BODY
+                if framed and length:
+                    await reader.readexactly(length)
+
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    status, content_type, body, state = 400, 'text/plain', b'Malformed request line\n', None
+                    version = 'HTTP/1.0'
+                else:
+                    status, content_type, body, state = await self.respond(method, target)
+                keep_alive = framed and version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                head = [f'HTTP/1.1 {status} {REASONS[status]}', f'Content-Type: {content_type}',
+                        f'Content-Length: {len(body)}', f'Connection: {"keep-alive" if keep_alive else "close"}']
+                if state:
+                    head.append(f'X-Cache: {state}')
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def _serve(pool, host, port, cache_bytes, max_concurrent, max_queue):
+    server = RenderServer(pool, max_concurrent, cache_bytes, max_queue)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f'Serving charts on http://{host}:{port}/ (e.g. /cournot.png?a=50&c=1)')
+    async with listener:
+        await listener.serve_forever()
+
+def serve(host='127.0.0.1', port=8000, workers=None, cache_bytes=256 * 2 ** 20, max_concurrent=None, max_queue=64):
+    workers = workers or os.cpu_count() or 1
+    # Start and warm every worker before the event loop exists, so the forked
+    # processes do not inherit it
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker)
+    wait([pool.submit(_warm) for _ in range(workers)])
+    try:
+        asyncio.run(_serve(pool, host, port, cache_bytes, max_concurrent or workers, max_queue))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown(cancel_futures=True)
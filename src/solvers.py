@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+import numpy as np
+from src import kernels, oligopoly
+
+# Closed-form best responses and Nash equilibria.
+#
+# A best-response curve is a list of polyline segments in (own action,
+# opponent action, payoff) coordinates, sampled at num_points along the
+# opponent's action, so its cost grows linearly with grid resolution. A
+# segment is 'attained' when the best response actually exists there; the
+# Bertrand undercutting segment is only a supremum (any price just below the
+# rival's does better than matching it). The duopolies are the N=2 case of
+# the markets in src/oligopoly.py.
+Segment = namedtuple('Segment', ['x', 'y', 'z', 'attained'])
+
+def swap_players(segments):
+    # The same curves seen from the other player in a symmetric game: Player
+    # 2's best response to Player 1 plotted on the (P1, P2) axes
+    return [Segment(s.y, s.x, s.z, s.attained) for s in segments]
+
+def _span(lo, hi, num_points):
+    return np.linspace(lo, max(lo, hi), num_points)
+
+def cournot_best_response(a, c, q_max, num_points):
+    q2 = _span(0, q_max, num_points)
+    q1 = oligopoly.cournot_best_response(a, c, q2)
+    return [Segment(q1, q2, kernels.cournot_payoff(q1, q2, c, a), True)]
+
+def cournot_nash(a, c):
+    q1, q2 = oligopoly.cournot_equilibrium(a, [c, c]).tolist()
+    return q1, q2, float(kernels.cournot_payoff(q1, q2, c, a)), float(kernels.cournot_payoff(q2, q1, c, a))
+
+def bertrand_best_response(a, c, p_max, num_points):
+    p_m = 1/2 * (a + c)
+    segments = []
+
+    # Rival prices below cost: price at cost and sell nothing
+    p2 = _span(0, min(c, p_max), num_points)
+    p1 = np.full_like(p2, c)
+    segments.append(Segment(p1, p2, kernels.bertrand_payoff(p1, p2, c, a), True))
+
+    # Rival prices between cost and the monopoly price: undercut by an
+    # arbitrarily small amount and take the whole market
+    if c < p_max:
+        p2 = _span(c, min(p_m, p_max), num_points)
+        p1 = p2.copy()
+        segments.append(Segment(p1, p2, (p1 - c) * (a - p1), False))
+
+    # Rival prices above the monopoly price: charge the monopoly price
+    if p_m < p_max:
+        p2 = _span(p_m, p_max, num_points)
+        p1 = np.full_like(p2, p_m)
+        segments.append(Segment(p1, p2, kernels.bertrand_payoff(p1, p2, c, a), True))
+
+    return segments
+
+def bertrand_nash(a, c):
+    p1, p2 = oligopoly.bertrand_equilibrium(a, [c, c]).tolist()
+    return p1, p2, float(kernels.bertrand_payoff(p1, p2, c, a)), float(kernels.bertrand_payoff(p2, p1, c, a))
+
+def brf_best_response(c, a_max, num_points):
+    a2 = _span(0, a_max, num_points)
+    a1 = 1/2 * (c + a2)
+    return [Segment(a1, a2, kernels.brf_payoff(a1, a2, c), True)]
+
+def brf_nash(c):
+    payoff = float(kernels.brf_payoff(c, c, c))
+    return c, c, payoff, payoff
@@ -0,0 +1,220 @@
+import csv
+import hashlib
+import itertools
+import os
+import shutil
+import zipfile
+from multiprocessing import Pool
+
+import numpy as np
+from src import kernels, registry
+
+# Parameter sweeps over (game, a, c, num_points).
+#
+# Each row holds the analytic Nash equilibrium (actions, market price and
+# quantity, payoffs) and a few statistics of the game's payoff surface on a
+# num_points x num_points grid. Rows are computed in chunks across a process
+# pool and streamed to CSV, NPZ or Parquet as chunks complete. Finished chunk
+# ids go to <output>.progress and a hash of the chunked task list to
+# <output>.tasks, so an interrupted sweep can be resumed with the same
+# arguments and only with them.
+
+COLUMNS = ['game', 'a', 'c', 'num_points', 'x1', 'x2', 'price', 'quantity', 'payoff_1', 'payoff_2',
+           'grid_max_payoff', 'grid_best_response_mean', 'grid_equilibrium_gap']
+
+DTYPE = np.dtype([('game', 'U8')] + [(name, 'f8') for name in COLUMNS[1:]])
+
+def parse_values(spec, dtype=float):
+    # 'start:stop:num' is an inclusive linspace, anything else a comma separated list
+    if ':' in spec:
+        start, stop, num = spec.split(':')
+        values = np.linspace(float(start), float(stop), int(num))
+    else:
+        values = np.array([float(v) for v in spec.split(',')])
+    return [dtype(v) for v in values]
+
+def sweep_row(game, a, c, num_points):
+    payoff, x_max, nash, price, quantity = registry.game_definition(game, a, c)
+    x1, x2, payoff_1, payoff_2 = nash
+
+    points = np.linspace(0, x_max, num_points)
+    X, Y = kernels.open_grid(points)
+    # Rows are the rival's action, columns Player 1's own action
+    payoff_values = payoff(X, Y)
+    best_response = points[np.argmax(payoff_values, axis=1)]
+
+    # How much Player 1 could gain by deviating from the grid point nearest
+    # the equilibrium, i.e. how far the grid is from having an exact equilibrium
+    i, j = np.abs(points - x2).argmin(), np.abs(points - x1).argmin()
+    gap = payoff_values[i].max() - payoff_values[i, j]
+
+    return (game, a, c, num_points, x1, x2, price, quantity, payoff_1, payoff_2,
+            payoff_values.max(), best_response.mean(), gap)
+
+def sweep_tasks(games, a_values, c_values, num_points_values):
+    for game in games:
+        # The BRF game has no 'a'
+        for a in ([np.nan] if game == 'brf' else a_values):
+            for c, num_points in itertools.product(c_values, num_points_values):
+                if game != 'brf' and a <= c:
+                    continue
+                yield game, a, c, num_points
+
+def run_chunk(job):
+    chunk_id, tasks = job
+    return chunk_id, [sweep_row(*task) for task in tasks]
+
+class CsvWriter:
+    # Rows carry their chunk id in an extra column. A chunk whose rows did not
+    # all reach the file before an interruption is dropped on resume and run
+    # again, so it is never written twice.
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def completed(self, sizes):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline='') as f:
+            lines = f.readlines()
+        groups = []
+        for line in lines[1:]:
+            row = next(csv.reader([line]))
+            chunk_id = int(row[-1]) if line.endswith('\n') and len(row) == len(COLUMNS) + 1 else None
+            if groups and groups[-1][0] == chunk_id:
+                groups[-1][1].append(line)
+            else:
+                groups.append((chunk_id, [line]))
+        complete = [(chunk_id, rows) for chunk_id, rows in groups if chunk_id is not None and len(rows) == sizes.get(chunk_id)]
+        if len(complete) < len(groups):
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w', newline='') as f:
+                f.writelines(lines[:1] + [line for _, rows in complete for line in rows])
+            os.replace(temporary, self.path)
+        return {chunk_id for chunk_id, _ in complete}
+
+    def write(self, chunk_id, rows):
+        if self.file is None:
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self.file = open(self.path, 'a', newline='')
+            self.writer = csv.writer(self.file)
+            if new:
+                self.writer.writerow(COLUMNS + ['chunk'])
+        self.writer.writerows([row + (chunk_id,) for row in rows])
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+class NpzWriter:
+    # Every chunk becomes its own member of the archive, np.load(path) then
+    # gives one structured array per chunk. Chunks are first written as
+    # separate files to <output>.parts, each renamed into place once whole,
+    # and close() rebuilds the archive from the previous one and the parts
+    # and swaps it in, so an interruption never leaves a torn archive.
+    def __init__(self, path):
+        self.path = path
+        self.parts = path + '.parts'
+        os.makedirs(self.parts, exist_ok=True)
+
+    def completed(self, sizes):
+        names = [name for name in os.listdir(self.parts) if name.endswith('.npy')]
+        if os.path.exists(self.path):
+            with zipfile.ZipFile(self.path) as archive:
+                names += archive.namelist()
+        return {int(name[len('chunk_'):-len('.npy')]) for name in names}
+
+    def write(self, chunk_id, rows):
+        name = os.path.join(self.parts, f'chunk_{chunk_id:06d}.npy')
+        with open(name + '.tmp', 'wb') as f:
+            np.lib.format.write_array(f, np.array(rows, dtype=DTYPE))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(name + '.tmp', name)
+
+    def close(self):
+        parts = sorted(name for name in os.listdir(self.parts) if name.endswith('.npy'))
+        with zipfile.ZipFile(self.path + '.tmp', 'w', allowZip64=True) as archive:
+            if os.path.exists(self.path):
+                with zipfile.ZipFile(self.path) as previous:
+                    for name in previous.namelist():
+                        if name not in parts:
+                            archive.writestr(previous.getinfo(name), previous.read(name))
+            for name in parts:
+                archive.write(os.path.join(self.parts, name), name)
+        os.replace(self.path + '.tmp', self.path)
+        shutil.rmtree(self.parts)
+
+class ParquetWriter:
+    # A directory of part files, readable as one dataset
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('pyarrow is required for Parquet output')
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def completed(self, sizes):
+        return {int(name[len('part-'):-len('.parquet')]) for name in os.listdir(self.path)}
+
+    def write(self, chunk_id, rows):
+        table = self.pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows])
+        self.pq.write_table(table, os.path.join(self.path, f'part-{chunk_id:06d}.parquet'))
+
+    def close(self):
+        pass
+
+WRITERS = {'.csv': CsvWriter, '.npz': NpzWriter, '.parquet': ParquetWriter}
+
+def run_sweep(games, a_values, c_values, num_points_values, output, workers=None, chunk_size=256, resume=False):
+    ext = os.path.splitext(output)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f'Unsupported output format {ext!r}, use one of {", ".join(WRITERS)}')
+
+    tasks = list(sweep_tasks(games, a_values, c_values, num_points_values))
+    chunks = [(i, tasks[start:start + chunk_size]) for i, start in enumerate(range(0, len(tasks), chunk_size))]
+
+    progress_path, tasks_path = output + '.progress', output + '.tasks'
+    # Chunk ids only mean something for the same tasks split the same way
+    task_hash = hashlib.sha256(repr(chunks).encode()).hexdigest()
+    done = set()
+    if resume and (os.path.exists(output) or os.path.exists(progress_path)):
+        if not os.path.exists(tasks_path):
+            raise ValueError(f'Cannot resume {output}: {tasks_path} is missing, so its arguments are unknown')
+        with open(tasks_path) as f:
+            if f.read().strip() != task_hash:
+                raise ValueError(f'Cannot resume {output}: it was started with different games, values or chunk size')
+        if os.path.exists(progress_path):
+            with open(progress_path) as f:
+                done = {int(line) for line in f if line.strip()}
+    else:
+        for path in (output, progress_path, tasks_path, output + '.parts'):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+    with open(tasks_path, 'w') as f:
+        f.write(task_hash + '\n')
+
+    writer = WRITERS[ext](output)
+    # A chunk can reach the output just before an interruption without making
+    # it into the progress file, so the output is asked too
+    done |= writer.completed({chunk_id: len(chunk) for chunk_id, chunk in chunks})
+    pending = [chunk for chunk in chunks if chunk[0] not in done]
+    print(f'{len(tasks)} parameter sets in {len(chunks)} chunks, {len(pending)} to run')
+
+    try:
+        with Pool(workers) as pool, open(progress_path, 'a') as progress:
+            for completed, (chunk_id, rows) in enumerate(pool.imap_unordered(run_chunk, pending), 1):
+                writer.write(chunk_id, rows)
+                # Only record a chunk once its rows are on disk
+                progress.write(f'{chunk_id}\n')
+                progress.flush()
+                print(f'Chunk {chunk_id} done ({completed}/{len(pending)})')
+    finally:
+        writer.close()
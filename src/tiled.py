@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from src import kernels, registry
+
+# Payoff surfaces for grids too large to hold in memory.
+#
+# The square grid is processed in tile x tile blocks built from open grids, so
+# the only full-size arrays are the memory-mapped .npy outputs. Player 1's
+# surface is written tile by tile, Player 2's as the transposed tile (the
+# games are symmetric), and Player 1's best response on the grid is kept as a
+# running argmax per row. The readers below work on the maps a block or a
+# stride at a time, so neither side needs the whole surface in RAM.
+
+TILE = 2048
+
+FILES = ('payoff_1.npy', 'payoff_2.npy', 'best_response_1.npy')
+
+def tiles(num_rows, num_cols, tile=TILE):
+    for r in range(0, num_rows, tile):
+        for c in range(0, num_cols, tile):
+            yield slice(r, min(r + tile, num_rows)), slice(c, min(c + tile, num_cols))
+
+def write_surfaces(kernel, points, params, directory, tile=TILE, dtype=np.float32):
+    # kernel(own, other, *params) over np.meshgrid(points, points), written to
+    # directory/payoff_1.npy, payoff_2.npy and best_response_1.npy (Player 1's
+    # best action on the grid for every action of Player 2)
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    os.makedirs(directory, exist_ok=True)
+    payoff_1 = open_memmap(os.path.join(directory, FILES[0]), mode='w+', dtype=dtype, shape=(n, n))
+    payoff_2 = open_memmap(os.path.join(directory, FILES[1]), mode='w+', dtype=dtype, shape=(n, n))
+
+    best_value = np.full(n, -np.inf)
+    best_index = np.zeros(n, dtype=np.int64)
+    for rows, cols in tiles(n, n, tile):
+        X, Y = kernels.open_grid(points[cols], points[rows])
+        block = kernel(X, Y, *params)
+        payoff_1[rows, cols] = block
+        payoff_2[cols, rows] = block.T
+
+        # Strictly greater keeps the first maximum, like np.argmax on whole rows
+        index = block.argmax(axis=1)
+        value = block[np.arange(len(index)), index]
+        better = value > best_value[rows]
+        best_value[rows] = np.where(better, value, best_value[rows])
+        best_index[rows] = np.where(better, cols.start + index, best_index[rows])
+
+    payoff_1.flush()
+    payoff_2.flush()
+    np.save(os.path.join(directory, FILES[2]), points[best_index])
+    del payoff_1, payoff_2
+    return load_surfaces(directory)
+
+def load_surfaces(directory):
+    # Read-only maps of the files written by write_surfaces
+    return tuple(np.load(os.path.join(directory, name), mmap_mode='r') for name in FILES)
+
+def surface_stats(surface, tile=TILE):
+    # Min, max, mean and NaN count, reading a tile at a time
+    low, high, total, count, nans = np.inf, -np.inf, 0.0, 0, 0
+    for rows, cols in tiles(*surface.shape, tile):
+        block = np.asarray(surface[rows, cols], dtype=float)
+        finite = block[~np.isnan(block)]
+        nans += block.size - finite.size
+        if finite.size:
+            low, high = min(low, finite.min()), max(high, finite.max())
+            total += float(finite.sum())
+            count += finite.size
+    return {'min': float(low), 'max': float(high), 'mean': total / count if count else np.nan, 'nan': nans}
+
+def downsample_indices(n, max_points):
+    # Evenly strided indices that always include both ends
+    stride = max(int(np.ceil(n / max_points)), 1)
+    return np.unique(np.r_[0:n:stride, n - 1])
+
+def downsample(surface, max_points=500):
+    # Row and column indices and the strided surface, only touching the rows
+    # it keeps
+    rows = downsample_indices(surface.shape[0], max_points)
+    cols = downsample_indices(surface.shape[1], max_points)
+    return rows, cols, np.asarray(surface[rows][:, cols])
+
+def tile_lines(x, y, z, levels):
+    # {level: [(k, 2) arrays]} of one tile, with contourpy if installed. It
+    # comes with matplotlib from 3.6 on; older versions still have allsegs.
+    try:
+        from contourpy import contour_generator
+    except ImportError:
+        from matplotlib.figure import Figure
+
+        contours = Figure().add_subplot().contour(x, y, z, levels=sorted(set(levels)))
+        found = dict(zip(contours.levels.tolist(), contours.allsegs))
+        return {level: [line for line in found.get(level, []) if len(line)] for level in levels}
+    generator = contour_generator(x, y, z)
+    return {level: generator.lines(level) for level in levels}
+
+def contour_lines(surface, x_points, y_points, levels, tile=TILE):
+    # Contour polylines of the full-resolution surface as {level: [(k, 2)
+    # arrays]}. Tiles overlap by one row and column so lines meet at tile
+    # borders; a line crossing a border comes back as one piece per tile.
+    lines = {level: [] for level in levels}
+    num_rows, num_cols = surface.shape
+    for rows, cols in tiles(num_rows - 1, num_cols - 1, tile):
+        rows, cols = slice(rows.start, rows.stop + 1), slice(cols.start, cols.stop + 1)
+        for level, pieces in tile_lines(x_points[cols], y_points[rows], np.asarray(surface[rows, cols], dtype=float), levels).items():
+            lines[level].extend(pieces)
+    return lines
+
+def game_surfaces(game, a, c, num_points, directory, tile=TILE, dtype=np.float32):
+    # A game's surfaces on its usual plotting range (see registry.game_definition)
+    payoff, x_max, nash, price, quantity = registry.game_definition(game, a, c)
+    points = np.linspace(0, x_max, num_points)
+    return points, write_surfaces(payoff, points, (), directory, tile, dtype)
+
+def render_preview(game, a, c, directory, output, max_points=500):
+    # Draw saved surfaces with the game's renderer from a strided subsample.
+    # The surfaces are square, so rows and cols are the same indices.
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from src.solvers import Segment, swap_players
+
+    payoff, x_max, nash, price, quantity = registry.game_definition(game, a, c)
+    payoff_1, payoff_2, best_response = load_surfaces(directory)
+    points = np.linspace(0, x_max, len(best_response))
+    rows, cols, values_1 = downsample(payoff_1, max_points)
+    values_2 = np.asarray(payoff_2[cols][:, rows])
+
+    other = points[rows]
+    best_response_1 = [Segment(best_response[rows], other, payoff(best_response[rows], other), True)]
+    fig = plt.figure(figsize=(12, 10))
+    renderer = registry.load(game).make_renderer(fig, points[cols])
+    renderer.draw(None if game == 'brf' else a, c, values_1, values_2, best_response_1, swap_players(best_response_1), nash)
+    plt.tight_layout()
+    fig.savefig(output)
+    plt.close(fig)
@@ -0,0 +1,204 @@
+import csv
+from multiprocessing import Pool
+
+import numpy as np
+
+# Repeated prisoner's dilemma tournaments between strategy populations.
+#
+# Every player is a row of a few arrays (strategy kind and its parameters),
+# and a chunk of matches is a pair of index arrays into them. All matches of
+# a chunk play a round at once: each side's action is a boolean expression of
+# its kind, the round, its opponent's last action and whether it has been
+# triggered (grim). Per-round payoffs are kept as a (rounds, matches) array
+# and turned into normalized discounted averages for every delta with one
+# matrix product. Chunks run across a process pool and only return sums per
+# pair of strategies, so memory does not grow with the number of matches.
+#
+# The stage game is the one drawn by src/folk_theorum.py: (C, C) pays (2, 2),
+# (C, D) (0, 3), (D, C) (3, 0) and (D, D) (1, 1).
+
+# PAYOFF[own action, other action], cooperate = 0, defect = 1
+PAYOFF = np.array([[2, 0], [3, 1]], dtype=np.float32)
+
+ALLC, ALLD, GRIM, TFT, RANDOM, CYCLE = range(6)
+KINDS = {'allc': ALLC, 'alld': ALLD, 'grim': GRIM, 'tft': TFT, 'random': RANDOM, 'cycle': CYCLE}
+
+def parse_population(spec):
+    # Comma separated strategies, each name[:args][*count]:
+    #   allc, alld, grim, tft   always cooperate / defect, grim trigger, tit-for-tat
+    #   random:p                defect with probability p
+    #   cycle:i:n               repeat n - i cooperations then i defections (the
+    #                           cycles of compute_points in src/folk_theorum.py)
+    # Returns the strategy labels and the population arrays.
+    labels, members = [], []
+    for item in spec.split(','):
+        item, _, count = item.strip().partition('*')
+        name, *args = item.split(':')
+        if name not in KINDS:
+            raise ValueError(f'Unknown strategy {name!r}, use one of {", ".join(KINDS)}')
+        kind = KINDS[name]
+        prob = float(args[0]) if kind == RANDOM else 0.0
+        defections, length = (int(args[0]), int(args[1])) if kind == CYCLE else (0, 1)
+        if item not in labels:
+            labels.append(item)
+        members += [(labels.index(item), kind, prob, length, defections)] * int(count or 1)
+
+    label, kind, prob, length, defections = (np.array(column) for column in zip(*members))
+    population = {'label': label, 'kind': kind.astype(np.int8), 'prob': prob, 'length': length, 'defections': defections}
+    return labels, population
+
+def discount_weights(deltas, rounds):
+    # Normalized discounted average over the rounds: delta ** t / sum of
+    # delta ** t, the plain average for delta = 1. Shape (deltas, rounds).
+    t = np.arange(rounds)
+    weights = np.asarray(deltas, dtype=float)[:, None] ** t
+    return (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+def round_robin_pairs(num_players, start, stop):
+    # Matches start..stop of all unordered pairs i < j, numbered row by row,
+    # without building the whole list
+    k = np.arange(start, stop, dtype=np.int64)
+    # Row i starts at match i * (2n - i - 1) / 2
+    n = num_players
+    i = np.floor((2 * n - 1 - np.sqrt((2 * n - 1) ** 2 - 8 * k)) / 2).astype(np.int64)
+    # Guard against rounding at row boundaries
+    row_start = i * (2 * n - i - 1) // 2
+    i = np.where(k < row_start, i - 1, i)
+    i = np.where(k >= (i + 1) * (2 * n - i - 2) // 2, i + 1, i)
+    j = k - i * (2 * n - i - 1) // 2 + i + 1
+    return i, j
+
+def random_pairs(num_players, num_matches, rng):
+    i = rng.integers(num_players, size=num_matches)
+    # Shift the partner so nobody plays themselves
+    j = (i + rng.integers(1, num_players, size=num_matches)) % num_players
+    return i, j
+
+class Side:
+    # One side of every match in a chunk: its players' strategies as masks
+    # and parameters, plus the state carried between rounds
+    def __init__(self, population, players):
+        kind = population['kind'][players]
+        self.alld = kind == ALLD
+        self.grim = kind == GRIM
+        self.tft = kind == TFT
+        self.random = kind == RANDOM
+        self.cycle = kind == CYCLE
+        self.prob = population['prob'][players]
+        self.length = population['length'][players]
+        self.cooperations = self.length - population['defections'][players]
+        self.triggered = np.zeros(len(players), dtype=bool)
+        self.opponent_last = np.zeros(len(players), dtype=bool)
+
+    def act(self, t, rng):
+        action = self.alld | (self.grim & self.triggered) | (self.tft & self.opponent_last)
+        if self.random.any():
+            action |= self.random & (rng.random(len(action)) < self.prob)
+        if self.cycle.any():
+            action |= self.cycle & (t % self.length >= self.cooperations)
+        return action
+
+    def observe(self, opponent_action):
+        self.triggered |= opponent_action
+        self.opponent_last = opponent_action
+
+def play(population, first, second, rounds, weights, rng):
+    # Normalized discounted average payoffs of every match, shape
+    # (deltas, matches) for each side
+    side_1, side_2 = Side(population, first), Side(population, second)
+    payoffs_1 = np.empty((rounds, len(first)), dtype=np.float32)
+    payoffs_2 = np.empty((rounds, len(first)), dtype=np.float32)
+    for t in range(rounds):
+        action_1, action_2 = side_1.act(t, rng), side_2.act(t, rng)
+        payoffs_1[t] = PAYOFF[action_1.view(np.int8), action_2.view(np.int8)]
+        payoffs_2[t] = PAYOFF[action_2.view(np.int8), action_1.view(np.int8)]
+        side_1.observe(action_2)
+        side_2.observe(action_1)
+    return weights @ payoffs_1, weights @ payoffs_2
+
+def run_chunk(job):
+    # Sums of payoffs per (row strategy, column strategy, delta) and match
+    # counts per strategy pair, both sides of every match counted as a row
+    population, num_labels, pairing, bounds, rounds, deltas, seed = job
+    rng = np.random.default_rng(seed)
+    num_players = len(population['kind'])
+    if pairing == 'round_robin':
+        first, second = round_robin_pairs(num_players, *bounds)
+    else:
+        first, second = random_pairs(num_players, bounds[1] - bounds[0], rng)
+
+    payoffs_1, payoffs_2 = play(population, first, second, rounds, discount_weights(deltas, rounds), rng)
+    label_1, label_2 = population['label'][first], population['label'][second]
+    cells = num_labels * num_labels
+    pair_1 = label_1 * num_labels + label_2
+    pair_2 = label_2 * num_labels + label_1
+    sums = np.array([np.bincount(pair_1, p1, cells) + np.bincount(pair_2, p2, cells) for p1, p2 in zip(payoffs_1, payoffs_2)])
+    counts = np.bincount(pair_1, minlength=cells) + np.bincount(pair_2, minlength=cells)
+    return sums.reshape(len(deltas), num_labels, num_labels), counts.reshape(num_labels, num_labels)
+
+def run_tournament(population_spec, deltas, rounds=200, pairing='round_robin', num_matches=None, workers=None, chunk_size=16384, seed=0):
+    # Mean payoff of each strategy against each other strategy for every
+    # delta, shape (deltas, strategies, strategies), and the number of
+    # matches behind each entry
+    labels, population = parse_population(population_spec)
+    num_players = len(population['kind'])
+    if num_players < 2:
+        raise ValueError('A tournament needs at least two players')
+    total = num_players * (num_players - 1) // 2 if pairing == 'round_robin' else num_matches
+    if not total:
+        raise ValueError('Random pairing needs a number of matches')
+
+    bounds = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+    jobs = [(population, len(labels), pairing, b, rounds, list(deltas), s) for b, s in zip(bounds, seeds)]
+    print(f'{num_players} players, {total} matches of {rounds} rounds in {len(jobs)} chunks')
+
+    sums = np.zeros((len(deltas), len(labels), len(labels)))
+    counts = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    with Pool(workers) as pool:
+        for chunk_sums, chunk_counts in pool.imap_unordered(run_chunk, jobs):
+            sums += chunk_sums
+            counts += chunk_counts
+    with np.errstate(invalid='ignore'):
+        means = sums / counts
+    return labels, means, counts
+
+def write_results(path, labels, deltas, means, counts):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['delta', 'strategy', 'opponent', 'payoff', 'opponent_payoff', 'matches'])
+        for d, delta in enumerate(deltas):
+            for i, strategy in enumerate(labels):
+                for j, opponent in enumerate(labels):
+                    if counts[i, j]:
+                        writer.writerow([delta, strategy, opponent, means[d, i, j], means[d, j, i], counts[i, j]])
+
+def print_standings(labels, deltas, means, counts):
+    # Average payoff of each strategy over all of its matches, per delta
+    for d, delta in enumerate(deltas):
+        overall = np.nansum(means[d] * counts, axis=1) / counts.sum(axis=1)
+        ranking = ', '.join(f'{labels[i]} {overall[i]:.3f}' for i in np.argsort(-overall))
+        print(f'delta={delta:g}: {ranking}')
+
+def plot_results(path, labels, deltas, means, delta_index=-1):
+    # Mean payoffs of every pairing of strategies as points in the stage
+    # game's feasible payoff set, the hull drawn by the folk theorem game
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from src.folk_theorum import SEGMENTS
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    for (x1, y1), (x2, y2) in SEGMENTS:
+        ax.plot([x1, x2], [y1, y2], color='grey')
+    for i, strategy in enumerate(labels):
+        x, y = means[delta_index, i], means[delta_index, :, i]
+        ax.scatter(x, y, s=60, label=strategy)
+    ax.set_xlim(0, 3)
+    ax.set_ylim(0, 3)
+    ax.set_xlabel('Average payoff of the strategy')
+    ax.set_ylabel('Average payoff of its opponent')
+    ax.set_title(f'Tournament payoffs (Delta={deltas[delta_index]:g})')
+    ax.legend()
+    fig.savefig(path)
+    plt.close(fig)